@@ -0,0 +1,110 @@
+import glob
+import os
+import threading
+from typing import Dict, Optional
+
+import zstandard as zstd
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+# Values are stored either as a zstd frame or, when short or incompressible, as plain UTF-8.
+# Valid UTF-8 text can never start with the zstd magic (0x28 0xB5 ...), which also lets rows
+# migrated straight from TEXT columns be read without rewriting them first.
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+MIN_COMPRESS_SIZE = 128
+COMPRESSION_LEVEL = 9
+
+# Trained dictionaries (see train_compression_dictionary.py). Every dictionary found is kept
+# for decompression, keyed by the dict id recorded in each frame; new values are compressed
+# with ZSTD_DICTIONARY, or the newest file if unset.
+DICTIONARY_DIR = os.getenv("ZSTD_DICTIONARY_DIR", os.path.join(os.path.dirname(__file__), "data", "zstd"))
+
+_dictionaries: Optional[Dict[int, zstd.ZstdCompressionDict]] = None
+_active_dictionary: Optional[zstd.ZstdCompressionDict] = None
+_load_lock = threading.Lock()
+_local = threading.local()
+
+
+def _load_dictionaries():
+    global _dictionaries, _active_dictionary
+    with _load_lock:
+        if _dictionaries is not None:
+            return
+        dictionaries = {}
+        paths = sorted(glob.glob(os.path.join(DICTIONARY_DIR, "*.dict")), key=os.path.getmtime)
+        active = None
+        for path in paths:
+            with open(path, "rb") as fh:
+                dictionary = zstd.ZstdCompressionDict(fh.read())
+            dictionaries[dictionary.dict_id()] = dictionary
+            if os.path.basename(path) == os.getenv("ZSTD_DICTIONARY") or not os.getenv("ZSTD_DICTIONARY"):
+                active = dictionary
+        if active is not None:
+            active.precompute_compress(level=COMPRESSION_LEVEL)
+        _active_dictionary = active
+        _dictionaries = dictionaries
+
+
+def _compressor() -> zstd.ZstdCompressor:
+    # zstd contexts are not thread-safe; keep one per thread
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        _load_dictionaries()
+        if _active_dictionary is not None:
+            compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=_active_dictionary)
+        else:
+            compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+        _local.compressor = compressor
+    return compressor
+
+
+def _decompressor(dict_id: int) -> zstd.ZstdDecompressor:
+    decompressors = getattr(_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    decompressor = decompressors.get(dict_id)
+    if decompressor is None:
+        _load_dictionaries()
+        if dict_id:
+            if dict_id not in _dictionaries:
+                raise LookupError(f"zstd dictionary {dict_id} not found in {DICTIONARY_DIR}")
+            decompressor = zstd.ZstdDecompressor(dict_data=_dictionaries[dict_id])
+        else:
+            decompressor = zstd.ZstdDecompressor()
+        decompressors[dict_id] = decompressor
+    return decompressor
+
+
+def compress_text(value: Optional[str]) -> Optional[bytes]:
+    if value is None:
+        return None
+    raw = value.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return raw
+    compressed = _compressor().compress(raw)
+    return compressed if len(compressed) < len(raw) else raw
+
+
+def decompress_text(value: Optional[bytes]) -> Optional[str]:
+    if value is None:
+        return None
+    value = bytes(value)
+    if value.startswith(ZSTD_MAGIC):
+        dict_id = zstd.get_frame_parameters(value).dict_id
+        return _decompressor(dict_id).decompress(value).decode("utf-8")
+    return value.decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """Text stored zstd-compressed (optionally with a trained dictionary) in a binary column.
+
+    Pair with deferred() so the blob is only fetched and decompressed when accessed.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
@@ -1,11 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Date, Text, Boolean, LargeBinary, ForeignKey, Index, UniqueConstraint, event, func, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import sessionmaker, Session, relationship, deferred
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 
+from .compression import CompressedText
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -92,6 +94,7 @@ class Patient(Base):
     age = Column(Integer)
     medical_history = Column(ARRAY(String))
     allergies = Column(ARRAY(String))
+    clinical_specialties = Column(ARRAY(String))  # union of specialties found in this patient's OCR'd files
     consent_signed_at = Column(DateTime)
     
     user = relationship("User")
@@ -104,10 +107,10 @@ class Consultation(Base):
     patient_id = Column(Integer, ForeignKey("patients.id"))
     doctor_id = Column(Integer, ForeignKey("users.id"))
     date = Column(DateTime)
-    symptoms = Column(Text)
+    symptoms = Column(CompressedText)  # read by every consultation list, so not deferred
     diagnosis = Column(Text)
     prescription = Column(Text)
-    notes = Column(Text)
+    notes = deferred(Column(CompressedText))
     status = Column(String(50), default="scheduled")
     client_id = Column(String(64), unique=True, nullable=True)  # idempotency for offline sync
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -126,15 +129,69 @@ class MedicalFile(Base):
     original_name = Column(String(255))
     file_type = Column(String(10))
     file_size = Column(Integer)
+    content_hash = Column(String(64), index=True)  # SHA-256 of plaintext, keys the derivative cache
     uploaded_by = Column(Integer, ForeignKey("users.id"))
-    ocr_text = Column(Text)
+    ocr_text = deferred(Column(CompressedText))  # fetched and decompressed only when accessed
+    # Full-text search vector over OCR output, GIN-indexed. Postgres cannot tokenise the
+    # compressed ocr_text itself, so it is set from the plaintext on write (see below).
+    ocr_tsv = deferred(Column(TSVECTOR))
+    # Keywords extracted once at OCR time so recommendation never rescans ocr_text
+    clinical_keywords = Column(ARRAY(String))
+    clinical_specialties = Column(ARRAY(String))
     description = Column(Text)
     category = Column(String(50))  # lab_results, x_ray, prescription, report
+    
+    # DICOM header fields, indexed for radiology lookups (NULL for non-DICOM files)
+    dicom_modality = Column(String(16), index=True)
+    dicom_study_date = Column(Date, index=True)
+    dicom_body_part = Column(String(64), index=True)
+    dicom_study_uid = Column(String(64), index=True)
+    dicom_frame_count = Column(Integer)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     
     patient = relationship("Patient")
     consultation = relationship("Consultation")
     uploader = relationship("User", foreign_keys=[uploaded_by])
+    
+    __table_args__ = (
+        Index("ix_medical_files_ocr_tsv", "ocr_tsv", postgresql_using="gin"),
+    )
+
+@event.listens_for(MedicalFile, "before_insert")
+@event.listens_for(MedicalFile, "before_update")
+def _update_ocr_search_vector(mapper, connection, target):
+    if connection.dialect.name != "postgresql":
+        return
+    if inspect(target).attrs.ocr_text.history.has_changes():
+        target.ocr_tsv = func.to_tsvector("english", target.ocr_text or "")
+
+class VitalsChunk(Base):
+    """One patient-day of vital-sign readings packed as compressed column arrays (see vitals_service)"""
+    __tablename__ = "vitals_chunks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    reading_count = Column(Integer, default=0)
+    data = Column(LargeBinary)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("patient_id", "day", name="uq_vitals_chunks_patient_day"),
+    )
+
+class PatientVitalsState(Base):
+    """Latest observation per vital and the NEWS2 score derived from them, updated on ingest"""
+    __tablename__ = "patient_vitals_state"
+    
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+    latest = Column(Text)  # JSON: {vital: [epoch_ms, value]}
+    last_reading_at = Column(DateTime)
+    news2_score = Column(Integer)
+    news2_risk = Column(String(20))  # low, low-medium, medium, high
+    news2_complete = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class VerificationDocument(Base):
     __tablename__ = "verification_documents"
@@ -163,6 +220,15 @@ class Invite(Base):
     created_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class RevokedToken(Base):
+    """Access tokens revoked before they expire (logout); rows past expires_at can be purged"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    expires_at = Column(DateTime, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
+
 class MedicalFileAccess(Base):
     __tablename__ = "medical_file_access"
     
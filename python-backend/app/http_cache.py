@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+from .cache import TTLCache
+
+# Reference responses (decision tree, guidelines, drugs) are the same bytes for every user until
+# the knowledge data or triage rules change. "private": they still sit behind auth.
+REFERENCE_CACHE_CONTROL = os.getenv("REFERENCE_CACHE_CONTROL", "private, max-age=3600")
+
+# Serialised bodies are keyed by version, so a new release simply stops hitting old entries
+_responses = TTLCache(
+    maxsize=int(os.getenv("HTTP_RESPONSE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("HTTP_RESPONSE_CACHE_TTL", "86400"))
+)
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def serialize(namespace: str, version: str, payload: Any) -> CachedBody:
+    """JSON bytes with a strong ETag derived from the namespace, version and content"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha256(f"{namespace}\0{version}\0".encode("utf-8") + body).hexdigest()[:32]
+    return CachedBody(body, f'"{digest}"')
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def cached_json_response(
+    request: Request,
+    namespace: str,
+    key: Hashable,
+    version: str,
+    build: Callable[[], Any],
+    cache_control: str = REFERENCE_CACHE_CONTROL,
+) -> Optional[Response]:
+    """Pre-serialised JSON response for (namespace, key) at this version, or 304 if the client has it.
+
+    Entries are trusted for as long as the version is unchanged, so it must identify the content
+    (e.g. include a hash of the data files), not just a hand-maintained release number.
+
+    build() produces the payload on a miss; if it returns None nothing is cached and None is
+    returned so the route can answer as it does for unknown items.
+    """
+    cache_key = (namespace, version, key)
+    cached = _responses.get(cache_key)
+    if cached is None:
+        payload = build()
+        if payload is None:
+            return None
+        cached = serialize(namespace, version, payload)
+        _responses.set(cache_key, cached)
+
+    headers = {"ETag": cached.etag, "Cache-Control": cache_control}
+    if etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def invalidate(namespace: Optional[str] = None) -> int:
+    """Drop serialised responses (of one namespace, or all)"""
+    if namespace is None:
+        return _responses.invalidate()
+    return _responses.invalidate(lambda key: key[0] == namespace)
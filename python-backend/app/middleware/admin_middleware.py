@@ -1,33 +1,67 @@
 from fastapi import HTTPException, Depends
 from sqlalchemy.orm import Session
+from typing import NamedTuple, Optional
+import os
+
+from ..cache import TTLCache
 from ..database_enhanced import get_db, User, Admin
 from .auth_middleware import get_current_user
 
+class AdminGrant(NamedTuple):
+    admin_id: int
+    permissions: frozenset
+
+# Admin dashboards poll several endpoints every few seconds; permissions are resolved once per
+# request and reused across requests for this long (seconds) unless invalidated
+ADMIN_PERMISSION_TTL = float(os.getenv("ADMIN_PERMISSION_TTL", "30"))
+
+_admin_grants = TTLCache(maxsize=1024, ttl=ADMIN_PERMISSION_TTL)
+
+def resolve_admin(user_id: int, db: Session) -> Optional[AdminGrant]:
+    """The admin record's id and permission set for a user, or None if the user is not an admin"""
+    grant = _admin_grants.get(user_id)
+    if grant is None:
+        admin = db.query(Admin).join(User).filter(User.id == user_id).first()
+        if not admin:
+            return None  # not cached, so a newly created admin is recognised at once
+        grant = AdminGrant(admin.id, frozenset(admin.permissions or []))
+        _admin_grants.set(user_id, grant)
+    return grant
+
+def invalidate_admin_permissions(user_id: Optional[int] = None):
+    """Call after changing an admin's permissions (or all admins' if user_id is None)"""
+    if user_id is None:
+        _admin_grants.invalidate()
+    else:
+        _admin_grants.pop(user_id)
+
 def get_current_admin(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Verify current user has admin privileges"""
-    
+    """Verify current user has admin privileges.
+
+    Returns the token claims plus "adminId" and "permissions". FastAPI runs this once per
+    request however many permission checks depend on it.
+    """
+
     # Check if user has admin role
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
-    
+
     # Verify admin record exists
-    admin = db.query(Admin).join(User).filter(User.id == current_user["id"]).first()
-    if not admin:
+    grant = resolve_admin(current_user["id"], db)
+    if not grant:
         raise HTTPException(status_code=403, detail="Admin privileges not found")
-    
-    return current_user
+
+    return {**current_user, "adminId": grant.admin_id, "permissions": sorted(grant.permissions)}
 
 def require_admin_permission(permission: str):
     """Decorator to require specific admin permission"""
-    def permission_checker(current_admin: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
-        admin = db.query(Admin).join(User).filter(User.id == current_admin["id"]).first()
-        
-        if permission not in (admin.permissions or []):
+    def permission_checker(current_admin: dict = Depends(get_current_admin)):
+        if permission not in current_admin["permissions"]:
             raise HTTPException(
-                status_code=403, 
+                status_code=403,
                 detail=f"Permission '{permission}' required"
             )
-        
+
         return current_admin
-    
-    return permission_checker
\ No newline at end of file
+
+    return permission_checker
@@ -1,22 +1,113 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
+import hashlib
 import os
 import pyotp
 import logging
+import threading
+import time
+import uuid
 from datetime import datetime
+from typing import Dict, Optional
+
+from ..cache import TTLCache
+from ..database_enhanced import SessionLocal, RevokedToken
 
 security = HTTPBearer()
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRES_MINUTES = int(os.getenv("JWT_EXPIRES_MINUTES", "480"))
+# How often each process reloads the shared revocation list (seconds); a logout takes effect
+# immediately in the process that handled it and within this interval everywhere else
+REVOCATION_REFRESH_INTERVAL = float(os.getenv("JWT_REVOCATION_REFRESH_SECONDS", "30"))
+
+# Verified payloads keyed by the token's SHA-256, so repeated requests (polling) skip the HMAC
+# check and claim parsing. Expiry and revocation are re-checked on every hit.
+_verified_tokens = TTLCache(
+    maxsize=int(os.getenv("JWT_VERIFIED_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("JWT_VERIFIED_CACHE_TTL", "300"))
+)
+
+_secret: Optional[str] = None
+_revoked: Dict[str, float] = {}  # jti -> exp (epoch seconds)
+_revoked_loaded_at = 0.0
+_revocation_lock = threading.Lock()
+
+def jwt_secret() -> str:
+    """The signing key, read from JWT_SECRET once per process"""
+    global _secret
+    if _secret is None:
         secret = os.getenv("JWT_SECRET")
         if not secret:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="JWT secret not configured")
-        payload = jwt.decode(credentials.credentials, secret, algorithms=["HS256"])
-        return payload
-    except JWTError:
+        _secret = secret
+    return _secret
+
+def create_access_token(claims: dict) -> str:
+    """Signed access token for claims, with iat, exp (JWT_EXPIRES_MINUTES) and a unique jti"""
+    now = int(time.time())
+    payload = {**claims, "iat": now, "exp": now + JWT_EXPIRES_MINUTES * 60, "jti": uuid.uuid4().hex}
+    return jwt.encode(payload, jwt_secret(), algorithm=JWT_ALGORITHM)
+
+def _refresh_revocations(force: bool = False):
+    global _revoked, _revoked_loaded_at
+    now = time.monotonic()
+    if not force and now - _revoked_loaded_at < REVOCATION_REFRESH_INTERVAL:
+        return
+    with _revocation_lock:
+        if not force and now - _revoked_loaded_at < REVOCATION_REFRESH_INTERVAL:
+            return
+        _revoked_loaded_at = now
+        db = SessionLocal()
+        try:
+            rows = db.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+                RevokedToken.expires_at > datetime.utcnow()
+            ).all()
+        except Exception as e:
+            # Keep the last known list; the next interval retries
+            logger.error(f"Failed to refresh revoked tokens: {str(e)}")
+            return
+        finally:
+            db.close()
+        revoked = {jti: (expires_at - datetime(1970, 1, 1)).total_seconds() for jti, expires_at in rows}
+        # Keep local revocations that have not reached the database listing yet
+        revoked.update({jti: exp for jti, exp in _revoked.items() if exp > time.time()})
+        _revoked = revoked
+
+def is_revoked(jti: Optional[str]) -> bool:
+    _refresh_revocations()
+    return jti in _revoked
+
+def revoke_token(jti: str, exp: float, user_id: Optional[int] = None):
+    """Revoke a token until it expires: recorded for all processes and applied here at once"""
+    db = SessionLocal()
+    try:
+        if not db.query(RevokedToken).filter(RevokedToken.jti == jti).first():
+            db.add(RevokedToken(jti=jti, user_id=user_id, expires_at=datetime.utcfromtimestamp(exp)))
+            db.commit()
+    finally:
+        db.close()
+    # Cached verifications need no flush: every hit is checked against the revocation list
+    _revoked[jti] = float(exp)
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode("utf-8")).digest()
+    payload = _verified_tokens.get(cache_key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, jwt_secret(), algorithms=[JWT_ALGORITHM], options={"require_exp": True})
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        _verified_tokens.set(cache_key, payload)
+    elif payload["exp"] <= time.time():
+        _verified_tokens.pop(cache_key)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+    # Callers get their own copy; the cached payload is shared
+    return dict(payload)
 
 def get_current_user(token_data: dict = Depends(verify_token)):
     return token_data
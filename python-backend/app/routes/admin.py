@@ -11,7 +11,9 @@ from datetime import datetime
 
 from ..middleware.auth_middleware import get_current_user, audit_log
 from ..middleware.admin_middleware import require_admin_permission
-from ..database_enhanced import get_db, User, DoctorProfile, VerificationDocument, Admin, Patient, Consultation, MedicalFile, AuditLog
+from ..database_enhanced import get_db, User, DoctorProfile, VerificationDocument, Patient, Consultation, MedicalFile, AuditLog
+from ..services.doctor_directory import doctor_directory
+from ..services.ai_recommendation import AIRecommendationService
 from app.limits import limiter
 from passlib.context import CryptContext
 import secrets
@@ -49,13 +51,12 @@ async def get_recent_activity(
     return activities
 
 @router.get("/me")
-async def get_admin_me(current_admin: dict = Depends(require_admin_permission("user_management")), db: Session = Depends(get_db)):
-    admin_row = db.query(Admin).join(User).filter(User.id == current_admin["id"]).first()
+async def get_admin_me(current_admin: dict = Depends(require_admin_permission("user_management"))):
     return {
         "id": current_admin["id"],
         "email": current_admin.get("email"),
         "role": current_admin.get("role"),
-        "permissions": admin_row.permissions if admin_row else [],
+        "permissions": current_admin["permissions"],
         "name": current_admin.get("name", "Admin")
     }
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -437,8 +438,7 @@ async def approve_doctor(
     
     # Update verification status
     doctor_profile.verification_status = "verified"
-    admin_row = db.query(Admin).join(User).filter(User.id == current_admin["id"]).first()
-    doctor_profile.approved_by = admin_row.id if admin_row else None
+    doctor_profile.approved_by = current_admin["adminId"]
     doctor_profile.approved_at = datetime.utcnow()
     
     # Activate user account
@@ -446,6 +446,8 @@ async def approve_doctor(
     user.is_active = True
     
     db.commit()
+    doctor_directory.invalidate()
+    AIRecommendationService.invalidate_all()
     
     audit_log(
         "DOCTOR_APPROVED",
@@ -474,6 +476,8 @@ async def reject_doctor(
     doctor_profile.rejection_reason = reason
     
     db.commit()
+    doctor_directory.invalidate()
+    AIRecommendationService.invalidate_all()
     
     audit_log(
         "DOCTOR_REJECTED",
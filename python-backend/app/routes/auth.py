@@ -1,6 +1,5 @@
 from fastapi import APIRouter, HTTPException, Request, Depends, Form
 from pydantic import BaseModel, Field
-from jose import jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
@@ -8,7 +7,11 @@ import os
 import pyotp
 from typing import Optional
 
-from ..middleware.auth_middleware import verify_mfa, generate_mfa_secret, audit_log, get_current_user
+from ..middleware.auth_middleware import (
+    verify_mfa, generate_mfa_secret, audit_log, get_current_user, create_access_token, revoke_token,
+    JWT_EXPIRES_MINUTES
+)
+from ..middleware.admin_middleware import invalidate_admin_permissions
 from ..database_enhanced import User, Patient, DoctorProfile, VerificationDocument
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
@@ -100,6 +103,7 @@ async def create_super_admin(
         db.add(admin)
         db.commit()
         db.refresh(admin)
+        invalidate_admin_permissions(user.id)
         
         audit_log("SUPER_ADMIN_CREATED", user.id, {"email": email})
         
@@ -150,10 +154,7 @@ async def login(payload: LoginRequest, request: Request, db: Session = Depends(g
     
     # Create JWT token with user's actual role from database
     token_data = {"id": user.id, "email": user.email, "role": user.role}
-    jwt_secret = os.getenv("JWT_SECRET")
-    if not jwt_secret:
-        raise HTTPException(status_code=500, detail="JWT secret not configured")
-    token = jwt.encode(token_data, jwt_secret, algorithm="HS256")
+    token = create_access_token(token_data)
     
     audit_log("LOGIN_SUCCESS", user.id, {"email": payload.email, "role": user.role})
     
@@ -169,10 +170,20 @@ async def login(payload: LoginRequest, request: Request, db: Session = Depends(g
     
     return {
         "token": token,
+        "expiresIn": JWT_EXPIRES_MINUTES * 60,
         "user": user_data,
         "requiresMFA": False
     }
 
+@router.post("/logout")
+async def logout(current_user: dict = Depends(get_current_user)):
+    """Revoke the presented token for the rest of its lifetime"""
+    if not current_user.get("jti"):
+        raise HTTPException(status_code=400, detail="Token cannot be revoked")
+    revoke_token(current_user["jti"], current_user["exp"], current_user.get("id"))
+    audit_log("LOGOUT", current_user.get("id"), {"email": current_user.get("email")})
+    return {"message": "Logged out"}
+
 @router.post("/setup-mfa")
 async def setup_mfa(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     secret = generate_mfa_secret()
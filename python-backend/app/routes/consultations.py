@@ -3,8 +3,11 @@ from pydantic import BaseModel
 from datetime import datetime
 from sqlalchemy.orm import Session
 
-from ..middleware.auth_middleware import get_current_user
+from ..middleware.auth_middleware import get_current_user, audit_log
 from ..database_enhanced import get_db, Consultation, Patient, User
+from ..services.doctor_directory import doctor_load
+from ..services.case_similarity import case_similarity
+from ..services.knowledge_base import knowledge_base
 
 router = APIRouter()
 
@@ -57,6 +60,7 @@ async def book_consultation(
     db.add(consultation)
     db.commit()
     db.refresh(consultation)
+    doctor_load.transition(None, None, consultation.doctor_id, consultation.status)
     
     print(f"Consultation created: id={consultation.id}, patient_id={consultation.patient_id}, doctor_id={consultation.doctor_id}")
     
@@ -90,8 +94,12 @@ async def update_consultation_status(
         print(f"Authorization failed: consultation.doctor_id={consultation.doctor_id}, current_user_id={current_user['id']}")
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    previous_status = consultation.status
     consultation.status = status_data.status
     db.commit()
+    doctor_load.transition(consultation.doctor_id, previous_status, consultation.doctor_id, consultation.status)
+    if consultation.status == "completed":
+        case_similarity.add_case(consultation.id, consultation.doctor_id, consultation.symptoms, consultation.diagnosis)
     
     print(f"Consultation {consultation_id} status updated to {status_data.status}")
     
@@ -148,9 +156,30 @@ async def update_consultation(
         consultation.prescription = update_data.prescription
     
     db.commit()
+    if consultation.status == "completed":
+        # Diagnosis recorded after completion refreshes the case in the similarity index
+        case_similarity.add_case(consultation.id, consultation.doctor_id, consultation.symptoms, consultation.diagnosis)
     
-    return {
+    response = {
         "message": "Consultation updated",
         "diagnosis": consultation.diagnosis,
         "prescription": consultation.prescription
-    }
\ No newline at end of file
+    }
+    if update_data.prescription:
+        # Warn (never block) on interactions and on conflicts with the patient's allergies and history
+        patient = db.query(Patient).filter(Patient.id == consultation.patient_id).first()
+        check = knowledge_base.check_prescription(
+            update_data.prescription.splitlines(),
+            patient.allergies if patient else None,
+            patient.medical_history if patient else None
+        )
+        response["prescriptionCheck"] = check
+        if check["hasWarnings"]:
+            audit_log("PRESCRIPTION_WARNINGS", current_user["id"], {
+                "consultation_id": consultation.id,
+                "interactions": check["interactions"],
+                "contraindications": check["contraindications"],
+                "allergies": check["allergies"]
+            })
+    
+    return response
\ No newline at end of file
@@ -3,8 +3,10 @@ from typing import List, Optional
 from sqlalchemy.orm import Session
 
 from app.middleware.auth_middleware import get_current_user
-from app.database_enhanced import get_db, User, DoctorProfile, Patient, Consultation
-from ..services.ai_recommendation import AIRecommendationService
+from app.database_enhanced import get_db, User, Patient, Consultation
+from ..services.ai_recommendation import AIRecommendationService, recommendation_cache
+from ..services.doctor_directory import doctor_directory
+from ..services.case_similarity import case_similarity
 
 router = APIRouter()
 
@@ -99,35 +101,36 @@ async def match_specialist(
     specialization: Optional[str] = Query(None, description="Desired specialty, e.g., cardiology"),
     state: Optional[str] = Query(None, description="Two-letter state code for telemedicine"),
     limit: int = Query(5, ge=1, le=50),
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: dict = Depends(get_current_user)
 ) -> List[dict]:
     """Match verified doctors by specialization and optional state.
-    Returns basic doctor info suitable for selection.
+    Returns basic doctor info suitable for selection, least busy doctors first.
     """
-    q = db.query(DoctorProfile, User).join(User, DoctorProfile.user_id == User.id)
-    # Only active/verified doctors
-    q = q.filter(User.role == "doctor")
-    q = q.filter(DoctorProfile.verification_status == "verified")
-
-    if specialization:
-        q = q.filter(DoctorProfile.primary_specialization.ilike(f"%{specialization}%"))
-    if state:
-        state_u = state.upper()
-        q = q.filter(DoctorProfile.telemedicine_states.any(state_u))
+    # Served from the in-process directory of verified doctors; no database round trip
+    return [doctor.to_dict() for doctor in doctor_directory.find(specialization, state, limit, least_loaded=True)]
 
-    q = q.limit(limit)
-    rows = q.all()
+@router.get("/similar-cases")
+async def similar_case_doctors(
+    symptoms: str = Query(..., min_length=2, description="Symptoms / working diagnosis to match against past cases"),
+    limit: int = Query(5, ge=1, le=20),
+    current_user: dict = Depends(get_current_user)
+) -> List[dict]:
+    """Verified doctors who have completed consultations most similar to the given symptoms"""
     results = []
-    for profile, user in rows:
-        results.append({
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "specialization": profile.primary_specialization,
-            "yearsOfPractice": profile.years_of_practice,
-            "telemedicineStates": profile.telemedicine_states,
+    # Over-fetch: doctors who are no longer verified are dropped below
+    for doctor_id, similarity, case_count in case_similarity.similar_doctors(symptoms, limit * 4):
+        doctor = doctor_directory.get(doctor_id)
+        if not doctor:
+            continue
+        entry = doctor.to_dict()
+        entry.update({
+            "similarity": round(similarity, 4),
+            "completedCases": case_count,
+            "matchReason": f"Past cases match these symptoms ({case_count} completed consultation(s) in total)"
         })
+        results.append(entry)
+        if len(results) >= limit:
+            break
     return results
 
 @router.get("/ai-recommend")
@@ -143,13 +146,18 @@ async def ai_recommend_doctors(
     if not patient:
         raise HTTPException(status_code=404, detail="Patient profile not found")
     
-    # Use AI service to recommend doctors
-    recommendations = AIRecommendationService.recommend_doctors(
-        db=db,
-        patient_symptoms=symptoms or "",
-        patient_medical_history=patient.medical_history or [],
-        patient_id=patient.id,
-        limit=5
+    # Use AI service to recommend doctors; repeat requests for the same inputs reuse the cached
+    # candidate scores and only re-rank them under the current doctor load
+    snapshot = doctor_directory.snapshot()
+    candidates = recommendation_cache.get_or_set(
+        AIRecommendationService.cache_key(patient.id, symptoms, patient.medical_history, snapshot),
+        lambda: AIRecommendationService.candidate_scores(
+            db=db,
+            patient_symptoms=symptoms or "",
+            patient_medical_history=patient.medical_history or [],
+            patient_id=patient.id,
+            snapshot=snapshot
+        )
     )
     
-    return recommendations
\ No newline at end of file
+    return AIRecommendationService.recommendations(candidates, limit=5)
\ No newline at end of file
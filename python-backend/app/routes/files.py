@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Tuple
 import os
-import shutil
 from datetime import datetime
 from sqlalchemy.orm import Session
 import pathlib
@@ -12,29 +13,93 @@ except Exception:
     magic = None
 
 from ..middleware.auth_middleware import get_current_user, audit_log
-from ..database_enhanced import get_db, MedicalFile, User, Patient
+from ..database_enhanced import get_db, MedicalFile, User, Patient, Consultation
 from ..services.ocr_service import OCRService
+from ..services.file_encryption import encrypt_stream, iter_stored_file, stored_file_size, stored_file_hash
+from ..services.dicom_service import DicomService
+from ..services.file_processing import FileProcessingService
+from ..services.derivatives import DerivativeService, PREVIEW_SIZES, TRANSCODE_TIERS, ORIGINAL_TIER, IMAGE_TYPES
 
 router = APIRouter()
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf", ".dcm"}
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_UPLOAD_FILES", "50"))
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".pdf": "application/pdf",
+    ".dcm": "application/dicom",
+}
 
-@router.post("/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    patientId: int = Form(...),
-    type: str = Form("general"),
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # Authorization: patients can only upload to their own profile
-    if current_user.get("role") == "patient":
+def _authorize_file_access(medical_file: MedicalFile, current_user: dict, db: Session):
+    """Patients may read their own files; doctors only files of patients they have consulted"""
+    role = current_user.get("role")
+    if role == "patient":
         patient = db.query(Patient).filter(Patient.user_id == current_user["id"]).first()
-        if not patient or patient.id != patientId:
-            raise HTTPException(status_code=403, detail="Not authorized to upload files for this patient")
+        if not patient or patient.id != medical_file.patient_id:
+            raise HTTPException(status_code=403, detail="Not authorized to access this file")
+    elif role == "doctor":
+        consulted = db.query(Consultation).filter(
+            Consultation.patient_id == medical_file.patient_id,
+            Consultation.doctor_id == current_user["id"]
+        ).first()
+        if not consulted:
+            audit_log("UNAUTHORIZED_FILE_ACCESS", current_user["id"], {
+                "file_id": medical_file.id,
+                "patient_id": medical_file.patient_id,
+                "reason": "no_consultation_history"
+            })
+            raise HTTPException(status_code=403, detail="Access denied: No consultation history with this patient")
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized to access this file")
+
+def _dicom_summary(medical_file: MedicalFile) -> dict:
+    return {
+        "modality": medical_file.dicom_modality,
+        "studyDate": medical_file.dicom_study_date.isoformat() if medical_file.dicom_study_date else None,
+        "bodyPart": medical_file.dicom_body_part,
+        "studyUid": medical_file.dicom_study_uid,
+        "frameCount": medical_file.dicom_frame_count
+    }
+
+async def _ensure_content_hash(medical_file: MedicalFile, file_path: str, db: Session) -> str:
+    """The file's content hash, backfilled for files uploaded before content hashing.
 
+    Computing it decrypts and hashes the whole file, so it runs in the threadpool.
+    """
+    if not medical_file.content_hash:
+        medical_file.content_hash = await run_in_threadpool(stored_file_hash, file_path)
+        db.commit()
+    return medical_file.content_hash
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=start-end` range; None means serve the whole file"""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_s, _, end_s = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            # Suffix range: last N bytes
+            start = max(size - int(end_s), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+def _store_upload(file: UploadFile) -> dict:
+    """Validate an upload and stream it, encrypted, into UPLOAD_DIR"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
@@ -49,46 +114,88 @@ async def upload_file(
     filename = f"{timestamp}-{unique_token}{file_ext}"
     file_path = os.path.join(UPLOAD_DIR, filename)
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Compute file size and validate MIME if possible
-    try:
-        file_size = os.path.getsize(file_path)
-    except Exception:
-        file_size = None
+    # Sniff the MIME type from the plaintext head; the stored file is encrypted
+    head = file.file.read(2048)
+    file.file.seek(0)
 
     if magic is not None:
         try:
-            detected_mime = magic.from_file(file_path, mime=True)
+            detected_mime = magic.from_buffer(head, mime=True)
             # Basic allowlist by MIME prefix for images/pdf and DICOM
             allowed_mimes = {"image/jpeg", "image/png", "application/pdf", "application/dicom", "application/dicom+json"}
             if detected_mime not in allowed_mimes:
-                os.remove(file_path)
                 raise HTTPException(status_code=400, detail="Unsupported file content type")
         except Exception:
             # If MIME detection fails, proceed but prefer conservative handling
             pass
+
+    # Encrypt at rest while streaming to disk
+    file_size, content_hash = encrypt_stream(file.file, file_path)
+
+    return {
+        "filename": filename,
+        "original_name": original_name,
+        "file_ext": file_ext,
+        "file_path": file_path,
+        "file_size": file_size,
+        "content_hash": content_hash
+    }
+
+def _remove_stored(file_paths):
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+@router.post("/upload")
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    patientId: int = Form(...),
+    type: str = Form("general"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Authorization: patients can only upload to their own profile
+    if current_user.get("role") == "patient":
+        patient = db.query(Patient).filter(Patient.user_id == current_user["id"]).first()
+        if not patient or patient.id != patientId:
+            raise HTTPException(status_code=403, detail="Not authorized to upload files for this patient")
+
+    # Encrypting and writing the upload is blocking work; keep it off the event loop
+    stored = await run_in_threadpool(_store_upload, file)
+    file_ext, file_path = stored["file_ext"], stored["file_path"]
+    content_hash = stored["content_hash"]
     
     # Extract text using OCR
     ocr_text = None
     if file_ext in [".jpg", ".jpeg", ".png", ".pdf"]:
         ocr_text = OCRService.extract_text_from_file(file_path)
     
+    # DICOM: index the header only; pixel data is decoded lazily per frame
+    dicom_meta = DicomService.read_metadata(file_path) if file_ext == ".dcm" else None
+    
     # Save to database
     medical_file = MedicalFile(
         patient_id=patientId,
-        filename=filename,
-        original_name=original_name,
+        filename=stored["filename"],
+        original_name=stored["original_name"],
         file_type=file_ext,
-        file_size=file_size if file_size is not None else 0,
-        uploaded_by=current_user["id"],
-        ocr_text=ocr_text
+        file_size=stored["file_size"],
+        content_hash=content_hash,
+        uploaded_by=current_user["id"]
     )
+    FileProcessingService.record_ocr_result(db, medical_file, ocr_text)
+    if dicom_meta:
+        DicomService.apply_metadata(medical_file, dicom_meta)
     db.add(medical_file)
     db.commit()
     db.refresh(medical_file)
     
+    # Thumbnails are rendered after the response is sent
+    background_tasks.add_task(DerivativeService.generate_previews, file_path, file_ext, content_hash)
+    
     audit_log("FILE_UPLOAD", current_user["id"], {"filename": file.filename, "patientId": patientId})
     
     return {
@@ -100,12 +207,101 @@ async def upload_file(
         "patientId": patientId,
         "type": type,
         "ocrText": ocr_text,
-        "hasOcr": bool(ocr_text)
+        "hasOcr": bool(ocr_text),
+        "dicom": _dicom_summary(medical_file) if dicom_meta else None
+    }
+
+@router.post("/upload-batch")
+async def upload_files_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    patientId: int = Form(...),
+    type: str = Form("general"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload many files for one patient in a single request.
+
+    Each file is streamed to encrypted storage, all rows are inserted in one transaction,
+    and OCR / DICOM indexing / previews run concurrently after the response is sent.
+    Invalid files are rejected individually without failing the rest of the batch.
+    """
+    if current_user.get("role") == "patient":
+        patient = db.query(Patient).filter(Patient.user_id == current_user["id"]).first()
+        if not patient or patient.id != patientId:
+            raise HTTPException(status_code=403, detail="Not authorized to upload files for this patient")
+
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+
+    results = []
+    accepted = []
+    try:
+        for index, file in enumerate(files):
+            try:
+                stored = await run_in_threadpool(_store_upload, file)
+            except HTTPException as e:
+                results.append({"index": index, "originalName": file.filename, "status": "rejected", "reason": e.detail})
+                continue
+            medical_file = MedicalFile(
+                patient_id=patientId,
+                filename=stored["filename"],
+                original_name=stored["original_name"],
+                file_type=stored["file_ext"],
+                file_size=stored["file_size"],
+                content_hash=stored["content_hash"],
+                uploaded_by=current_user["id"]
+            )
+            accepted.append((index, medical_file, stored["file_path"]))
+    except Exception:
+        # Nothing from this batch has a database row yet
+        _remove_stored(file_path for _, _, file_path in accepted)
+        raise
+
+    try:
+        db.add_all([medical_file for _, medical_file, _ in accepted])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _remove_stored(file_path for _, _, file_path in accepted)
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
+
+    for index, medical_file, _ in accepted:
+        results.append({
+            "index": index,
+            "id": medical_file.id,
+            "originalName": medical_file.original_name,
+            "size": medical_file.file_size,
+            "status": "stored",
+            "processing": "queued"
+        })
+    results.sort(key=lambda r: r["index"])
+
+    if accepted:
+        background_tasks.add_task(
+            FileProcessingService.process_files,
+            [(medical_file.id, file_path) for _, medical_file, file_path in accepted]
+        )
+
+    audit_log("FILE_UPLOAD_BATCH", current_user["id"], {
+        "patientId": patientId,
+        "stored": len(accepted),
+        "rejected": len(files) - len(accepted)
+    })
+
+    return {
+        "patientId": patientId,
+        "type": type,
+        "stored": len(accepted),
+        "rejected": len(files) - len(accepted),
+        "files": results
     }
 
 @router.get("/patient/{patient_id}")
 async def get_patient_files(
     patient_id: int,
+    modality: Optional[str] = Query(None, description="Only DICOM files of this modality, e.g. CT"),
+    body_part: Optional[str] = Query(None, description="Only DICOM files of this body part, e.g. CHEST"),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -118,9 +314,14 @@ async def get_patient_files(
     audit_log("FILE_ACCESS", current_user["id"], {"patientId": patient_id})
     
     # Single query with JOIN - eliminates N+1 problem
-    files_with_uploaders = db.query(MedicalFile, User).join(
+    query = db.query(MedicalFile, User).join(
         User, MedicalFile.uploaded_by == User.id
-    ).filter(MedicalFile.patient_id == patient_id).all()
+    ).filter(MedicalFile.patient_id == patient_id)
+    if modality:
+        query = query.filter(MedicalFile.dicom_modality == modality.upper())
+    if body_part:
+        query = query.filter(MedicalFile.dicom_body_part == body_part.upper())
+    files_with_uploaders = query.all()
     
     result = []
     for file, uploader in files_with_uploaders:
@@ -129,7 +330,215 @@ async def get_patient_files(
             "filename": file.original_name,
             "type": file.file_type,
             "uploadDate": file.created_at.isoformat(),
-            "uploadedBy": uploader.name
+            "uploadedBy": uploader.name,
+            "previewUrl": f"/api/files/{file.id}/preview",
+            "dicom": _dicom_summary(file) if file.file_type == ".dcm" else None
         })
     
-    return result
\ No newline at end of file
+    return result
+
+@router.get("/{file_id}/download")
+async def download_file(
+    file_id: int,
+    request: Request,
+    quality: Optional[str] = Query(None, description="Image tier: low, medium, high or original (diagnostic)"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream a medical file, decrypting only the chunks covered by the requested range.
+
+    Images are transcoded to a smaller tier when asked for explicitly or when the client
+    advertises Save-Data / a slow connection; quality=original always returns the upload.
+    """
+    if quality is not None and quality != ORIGINAL_TIER and quality not in TRANSCODE_TIERS:
+        raise HTTPException(status_code=400, detail="Invalid quality; choose low, medium, high or original")
+
+    medical_file = db.query(MedicalFile).filter(MedicalFile.id == file_id).first()
+    if not medical_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    _authorize_file_access(medical_file, current_user, db)
+
+    file_path = os.path.join(UPLOAD_DIR, medical_file.filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File content not found")
+
+    tier = DerivativeService.select_tier(quality, request.headers)
+    hint_headers = {
+        "Accept-CH": "Save-Data, ECT, Downlink",
+        "Vary": "Save-Data, ECT, Downlink"
+    }
+
+    if tier != ORIGINAL_TIER and medical_file.file_type in IMAGE_TYPES:
+        await _ensure_content_hash(medical_file, file_path, db)
+        # Decoding large photos is CPU-bound; keep it off the event loop
+        transcoded = await run_in_threadpool(
+            DerivativeService.get_transcoded,
+            file_path, medical_file.file_type, medical_file.content_hash, tier
+        )
+        if transcoded is not None:
+            audit_log("FILE_DOWNLOAD", current_user["id"], {
+                "file_id": file_id,
+                "patient_id": medical_file.patient_id,
+                "tier": tier
+            })
+            stem = os.path.splitext(medical_file.original_name)[0]
+            return Response(
+                content=transcoded,
+                media_type="image/webp",
+                headers={
+                    **hint_headers,
+                    "X-Image-Tier": tier,
+                    "Content-Disposition": f'attachment; filename="{stem}-{tier}.webp"'
+                }
+            )
+
+    size = stored_file_size(file_path)
+    byte_range = _parse_range(request.headers.get("range"), size)
+
+    audit_log("FILE_DOWNLOAD", current_user["id"], {
+        "file_id": file_id,
+        "patient_id": medical_file.patient_id,
+        "tier": ORIGINAL_TIER,
+        "range": request.headers.get("range")
+    })
+
+    headers = {
+        **hint_headers,
+        "X-Image-Tier": ORIGINAL_TIER,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{medical_file.original_name}"'
+    }
+    media_type = MEDIA_TYPES.get(medical_file.file_type, "application/octet-stream")
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_stored_file(file_path), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_stored_file(file_path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+@router.get("/{file_id}/preview")
+async def get_file_preview(
+    file_id: int,
+    request: Request,
+    size: str = Query("thumb", description="Preview size: thumb, small or medium"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Small WebP preview of an image or the first page of a PDF"""
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid preview size; choose from {sorted(PREVIEW_SIZES)}")
+
+    medical_file = db.query(MedicalFile).filter(MedicalFile.id == file_id).first()
+    if not medical_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    _authorize_file_access(medical_file, current_user, db)
+
+    file_path = os.path.join(UPLOAD_DIR, medical_file.filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File content not found")
+
+    # Files uploaded before content hashing get their hash backfilled on first preview
+    await _ensure_content_hash(medical_file, file_path, db)
+
+    # Previews are content-addressed, so the ETag never changes for a given file
+    etag = f'"{medical_file.content_hash}-{size}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    preview = await run_in_threadpool(
+        DerivativeService.get_preview, file_path, medical_file.file_type, medical_file.content_hash, size
+    )
+    if preview is None:
+        raise HTTPException(status_code=404, detail="No preview available for this file type")
+
+    audit_log("FILE_PREVIEW", current_user["id"], {"file_id": file_id, "size": size})
+
+    return Response(content=preview, media_type="image/webp", headers=cache_headers)
+
+def _get_dicom_file(file_id: int, current_user: dict, db: Session) -> Tuple[MedicalFile, str]:
+    medical_file = db.query(MedicalFile).filter(MedicalFile.id == file_id).first()
+    if not medical_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    _authorize_file_access(medical_file, current_user, db)
+    if medical_file.file_type != ".dcm":
+        raise HTTPException(status_code=400, detail="Not a DICOM file")
+    if not DicomService.available():
+        raise HTTPException(status_code=503, detail="DICOM support is not installed on this server")
+    file_path = os.path.join(UPLOAD_DIR, medical_file.filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File content not found")
+    return medical_file, file_path
+
+@router.get("/{file_id}/dicom")
+async def get_dicom_metadata(
+    file_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """DICOM header summary; parses the header again if it was not indexed at upload"""
+    medical_file, file_path = _get_dicom_file(file_id, current_user, db)
+
+    meta = await run_in_threadpool(DicomService.read_metadata, file_path)
+    if meta is None:
+        raise HTTPException(status_code=422, detail="Unable to parse DICOM header")
+    if medical_file.dicom_frame_count is None:
+        DicomService.apply_metadata(medical_file, meta)
+        db.commit()
+
+    audit_log("DICOM_METADATA_ACCESS", current_user["id"], {"file_id": file_id})
+
+    return {
+        "fileId": medical_file.id,
+        **_dicom_summary(medical_file),
+        "studyDescription": meta["study_description"],
+        "seriesDescription": meta["series_description"],
+        "rows": meta["rows"],
+        "columns": meta["columns"],
+        "frameUrlTemplate": f"/api/files/{medical_file.id}/dicom/frames/{{frame}}"
+    }
+
+@router.get("/{file_id}/dicom/frames/{frame}")
+async def get_dicom_frame(
+    file_id: int,
+    frame: int,
+    request: Request,
+    size: str = Query("medium", description="Render size: thumb, small or medium"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Render a single frame of a (multi-frame) DICOM file as WebP"""
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid size; choose from {sorted(PREVIEW_SIZES)}")
+
+    medical_file, file_path = _get_dicom_file(file_id, current_user, db)
+    if medical_file.dicom_frame_count is not None and not 0 <= frame < medical_file.dicom_frame_count:
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    await _ensure_content_hash(medical_file, file_path, db)
+
+    etag = f'"{medical_file.content_hash}-f{frame}-{size}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    try:
+        rendered = await run_in_threadpool(
+            DerivativeService.get_dicom_frame, file_path, medical_file.content_hash, frame, size
+        )
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    audit_log("DICOM_FRAME_VIEW", current_user["id"], {"file_id": file_id, "frame": frame})
+
+    return Response(content=rendered, media_type="image/webp", headers=cache_headers)
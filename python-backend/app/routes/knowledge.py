@@ -1,41 +1,87 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 from ..middleware.auth_middleware import get_current_user, audit_log
-from ..services.knowledge_base import KnowledgeBase
+from ..http_cache import cached_json_response, etag_matches
+from ..services.knowledge_index import normalize_key
+from ..services.knowledge_base import knowledge_base as kb
+from ..services.knowledge_pack import knowledge_packs
 
 router = APIRouter()
-kb = KnowledgeBase()
+
+SUGGESTION_TYPES = ("drug", "condition", "symptom")
+# Suggestions only change with a knowledge release, so clients may reuse them per keystroke prefix
+AUTOCOMPLETE_CACHE_CONTROL = "private, max-age=3600"
+# A pack or delta id names immutable content
+PACK_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# A delta to "latest" changes with every publish, so clients revalidate it by ETag
+LATEST_DELTA_CACHE_CONTROL = "private, no-cache"
 
 class SymptomAnalysis(BaseModel):
     symptoms: List[str]
 
+class InteractionCheck(BaseModel):
+    drugs: List[str] = Field(..., min_length=1, max_length=50, description="Drug names or free-text prescription lines")
+    allergies: Optional[List[str]] = None
+    medicalHistory: Optional[List[str]] = None
+
+@router.get("/autocomplete")
+async def autocomplete(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=64),
+    types: Optional[str] = Query(None, description="Comma-separated subset of drug, condition, symptom"),
+    limit: int = Query(10, ge=1, le=25),
+    current_user: dict = Depends(get_current_user)
+):
+    """Prefix and typo-tolerant suggestions for drug, condition and symptom names.
+
+    Not audited: it is called on every keystroke and only returns reference vocabulary.
+    """
+    wanted = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    if wanted and any(t not in SUGGESTION_TYPES for t in wanted):
+        raise HTTPException(status_code=400, detail=f"types must be among: {', '.join(SUGGESTION_TYPES)}")
+
+    response.headers["Cache-Control"] = AUTOCOMPLETE_CACHE_CONTROL
+    return {
+        "query": q,
+        "version": kb.version,
+        "suggestions": kb.suggestions.suggest(q, limit, wanted)
+    }
+
 @router.get("/drugs/{drug_name}")
 async def get_drug_info(
     drug_name: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     audit_log("DRUG_LOOKUP", current_user["id"], {"drug": drug_name})
     
-    drug_info = kb.get_drug_info(drug_name)
-    if not drug_info:
+    response = cached_json_response(
+        request, "knowledge.drug", normalize_key(drug_name), kb.version, lambda: kb.get_drug_info(drug_name)
+    )
+    if response is None:
         return {"error": "Drug not found"}
     
-    return drug_info
+    return response
 
 @router.get("/guidelines/{condition}")
 async def get_guidelines(
     condition: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     audit_log("GUIDELINE_ACCESS", current_user["id"], {"condition": condition})
     
-    guidelines = kb.get_guidelines(condition)
-    if not guidelines:
+    response = cached_json_response(
+        request, "knowledge.guideline", normalize_key(condition), kb.version, lambda: kb.get_guidelines(condition)
+    )
+    if response is None:
         return {"error": "Guidelines not found"}
     
-    return guidelines
+    return response
 
 @router.post("/analyze-symptoms")
 async def analyze_symptoms(
@@ -44,5 +90,63 @@ async def analyze_symptoms(
 ):
     audit_log("SYMPTOM_ANALYSIS", current_user["id"], {"symptoms": analysis_request.symptoms})
     
-    analysis = kb.analyze_symptoms(analysis_request.symptoms)
-    return {"possibleConditions": analysis}
\ No newline at end of file
+    matches = kb.rank_symptom_rules(analysis_request.symptoms)
+    return {
+        "possibleConditions": kb.conditions_from_matches(matches),
+        "matches": matches
+    }
+
+@router.post("/interactions/check")
+async def check_interactions(
+    check_request: InteractionCheck,
+    current_user: dict = Depends(get_current_user)
+):
+    audit_log("INTERACTION_CHECK", current_user["id"], {"drugs": check_request.drugs})
+
+    return kb.check_prescription(check_request.drugs, check_request.allergies, check_request.medicalHistory)
+
+
+@router.get("/pack/manifest")
+async def get_pack_manifest(current_user: dict = Depends(get_current_user)):
+    """Published offline knowledge packs (newest last). Clients holding an older listed pack
+    fetch /pack/delta/{their id}; others download /pack/{latest}."""
+    manifest = await run_in_threadpool(knowledge_packs.manifest)
+    return manifest
+
+@router.get("/pack/delta/{from_id}")
+async def get_pack_delta(
+    from_id: str,
+    request: Request,
+    to: Optional[str] = Query(None, description="Target pack id (default: latest)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """zstd patch-from delta turning pack from_id into the target pack; 404 means download the full pack"""
+    to_id = to or (await run_in_threadpool(knowledge_packs.manifest))["latest"]
+    delta = await run_in_threadpool(knowledge_packs.delta, from_id, to_id)
+    if delta is None:
+        raise HTTPException(status_code=404, detail="No delta available; download the full pack")
+
+    # Only an explicit (from, to) pair names immutable content
+    headers = {
+        "ETag": f'"{to_id}-{from_id}"',
+        "Cache-Control": PACK_CACHE_CONTROL if to else LATEST_DELTA_CACHE_CONTROL,
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    audit_log("KNOWLEDGE_PACK_DOWNLOAD", current_user["id"], {"from": from_id, "to": to_id, "delta": True})
+    return Response(content=delta, media_type="application/zstd", headers=headers)
+
+@router.get("/pack/{pack_id}")
+async def get_pack(
+    pack_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Full offline knowledge pack: gzip-compressed canonical JSON"""
+    path = await run_in_threadpool(knowledge_packs.pack_path, pack_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Knowledge pack not found")
+
+    audit_log("KNOWLEDGE_PACK_DOWNLOAD", current_user["id"], {"to": pack_id, "delta": False})
+    return FileResponse(path, media_type="application/gzip", filename=f"knowledge-{pack_id}.json.gz",
+                        headers={"Cache-Control": PACK_CACHE_CONTROL})
@@ -58,7 +58,8 @@ async def get_consultation_medical_files(
                 "category": file.category,
                 "description": file.description,
                 "uploaded_at": file.created_at.isoformat(),
-                "uploaded_by": file.uploader.name
+                "uploaded_by": file.uploader.name,
+                "preview_url": f"/api/files/{file.id}/preview"
             }
             for file in medical_files
         ]
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer
 from typing import List
 
 from ..middleware.auth_middleware import get_current_user, audit_log
-from ..database_enhanced import get_db, MedicalFile, Patient
+from ..database_enhanced import get_db, MedicalFile, Patient, Consultation
+from ..services.text_search import build_index, highlight
 
 router = APIRouter()
 
@@ -49,7 +51,7 @@ async def get_searchable_files(
         if not patient or patient.id != patient_id:
             raise HTTPException(status_code=403, detail="Not authorized to access these files")
     
-    files = db.query(MedicalFile).filter(
+    files = db.query(MedicalFile).options(undefer(MedicalFile.ocr_text)).filter(
         MedicalFile.patient_id == patient_id,
         MedicalFile.ocr_text.isnot(None)
     ).all()
@@ -64,4 +66,63 @@ async def get_searchable_files(
             "textPreview": file.ocr_text[:200] + "..." if len(file.ocr_text or "") > 200 else file.ocr_text
         })
     
-    return result
\ No newline at end of file
+    return result
+
+@router.get("/patient/{patient_id}/search")
+async def search_patient_files(
+    patient_id: int,
+    q: str = Query(..., min_length=2, description="Search terms, e.g. 'hba1c glucose'"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Ranked full-text search over a patient's OCR'd documents with highlighted snippets"""
+    
+    role = current_user.get("role")
+    if role == "patient":
+        patient = db.query(Patient).filter(Patient.user_id == current_user["id"]).first()
+        if not patient or patient.id != patient_id:
+            raise HTTPException(status_code=403, detail="Not authorized to access these files")
+    elif role == "doctor":
+        consulted = db.query(Consultation).filter(
+            Consultation.patient_id == patient_id,
+            Consultation.doctor_id == current_user["id"]
+        ).first()
+        if not consulted:
+            raise HTTPException(status_code=403, detail="Access denied: No consultation history with this patient")
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized to access these files")
+    
+    if db.bind.dialect.name == "postgresql":
+        # GIN index on ocr_tsv (kept current by the MedicalFile before_insert/update hook) does the matching; Postgres ranks
+        # plainto_tsquery (every term must match, no operators) so the SQLite fallback below agrees
+        tsquery = func.plainto_tsquery("english", q)
+        rank = func.ts_rank_cd(MedicalFile.ocr_tsv, tsquery)
+        rows = db.query(MedicalFile, rank.label("rank")).options(undefer(MedicalFile.ocr_text)).filter(
+            MedicalFile.patient_id == patient_id,
+            MedicalFile.ocr_tsv.op("@@")(tsquery)
+        ).order_by(rank.desc(), MedicalFile.id).limit(limit).all()
+        ranked = [(file, float(score)) for file, score in rows]
+    else:
+        # Fallback for databases without tsvector: in-memory inverted index over this patient's files
+        files = db.query(MedicalFile).options(undefer(MedicalFile.ocr_text)).filter(
+            MedicalFile.patient_id == patient_id,
+            MedicalFile.ocr_text.isnot(None)
+        ).all()
+        by_id = {file.id: file for file in files}
+        index = build_index((file.id, file.ocr_text) for file in files)
+        ranked = [(by_id[file_id], score) for file_id, score in index.search(q, limit)]
+    
+    audit_log("OCR_TEXT_SEARCH", current_user["id"], {"patient_id": patient_id, "results": len(ranked)})
+    
+    return [
+        {
+            "id": file.id,
+            "originalName": file.original_name,
+            "fileType": file.file_type,
+            "uploadDate": file.created_at.isoformat(),
+            "rank": round(score, 6),
+            "snippet": highlight(file.ocr_text, q)
+        }
+        for file, score in ranked
+    ]
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 
 from ..middleware.auth_middleware import get_current_user
 from ..database_enhanced import get_db, Patient, User, Consultation
+from ..services.ai_recommendation import AIRecommendationService
 from datetime import datetime
 
 router = APIRouter()
@@ -66,6 +67,7 @@ async def update_patient_profile(
         patient.allergies = update_data.allergies
     
     db.commit()
+    AIRecommendationService.invalidate_patient(patient.id)
     return {"message": "Profile updated"}
 
 @router.get("/consultations")
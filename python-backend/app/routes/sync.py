@@ -5,7 +5,8 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 
 from ..middleware.auth_middleware import get_current_user, audit_log
-from ..database_enhanced import get_db, Consultation, User, DoctorProfile, Patient
+from ..database_enhanced import get_db, Consultation, Patient
+from ..services.doctor_directory import doctor_directory, doctor_load
 
 router = APIRouter()
 
@@ -48,17 +49,9 @@ async def sync_consultations(
             doctor_id = item.doctorId
             if doctor_id is None and item.specialization:
                 # Find first verified doctor by specialization
-                doc = (
-                    db.query(DoctorProfile, User)
-                    .join(User, DoctorProfile.user_id == User.id)
-                    .filter(User.role == "doctor")
-                    .filter(DoctorProfile.verification_status == "verified")
-                    .filter(DoctorProfile.primary_specialization.ilike(f"%{item.specialization}%"))
-                    .first()
-                )
+                doc = doctor_directory.find(item.specialization, limit=1, least_loaded=True)
                 if doc:
-                    _, user = doc
-                    doctor_id = user.id
+                    doctor_id = doc[0].id
 
             # Parse date
             c_date = None
@@ -87,6 +80,7 @@ async def sync_consultations(
                     results.append({"clientId": item.clientId, "serverId": consult.id, "status": "skipped_newer_server"})
                     continue
                 # Apply updates (do not overwrite clinical fields like diagnosis unless provided)
+                previous_doctor_id = consult.doctor_id
                 if doctor_id is not None:
                     consult.doctor_id = doctor_id
                 if c_date is not None:
@@ -94,6 +88,7 @@ async def sync_consultations(
                 if item.symptoms is not None:
                     consult.symptoms = item.symptoms
                 db.commit()
+                doctor_load.transition(previous_doctor_id, consult.status, consult.doctor_id, consult.status)
                 results.append({"clientId": item.clientId, "serverId": consult.id, "status": "updated"})
                 continue
 
@@ -116,6 +111,7 @@ async def sync_consultations(
             db.add(consultation)
             db.commit()
             db.refresh(consultation)
+            doctor_load.transition(None, None, consultation.doctor_id, consultation.status)
 
             audit_log("SYNC_CONSULTATION_CREATED", current_user["id"], {"consultation_id": consultation.id})
             results.append({"clientId": item.clientId, "serverId": consultation.id, "status": "created"})
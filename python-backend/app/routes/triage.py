@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from collections import Counter
+import os
 
 from ..middleware.auth_middleware import get_current_user, audit_log
-from ..services.triage_engine import TriageEngine
+from ..http_cache import cached_json_response
+from ..services.triage_engine import triage_engine as engine
 
 router = APIRouter()
-engine = TriageEngine()
+
+MAX_BATCH_RECORDS = int(os.getenv("TRIAGE_BATCH_MAX_RECORDS", "100000"))
 
 class Vitals(BaseModel):
     heartRate: Optional[int] = None
@@ -30,21 +35,29 @@ async def assess_triage(payload: TriageRequest, current_user: dict = Depends(get
     audit_log("TRIAGE_ASSESS", current_user["id"], {"symptoms": payload.symptoms, "result": result})
     return result
 
+class TriageBatchRequest(BaseModel):
+    records: List[TriageRequest] = Field(default_factory=list, max_length=MAX_BATCH_RECORDS)
+
+@router.post("/assess-batch")
+async def assess_triage_batch(payload: TriageBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Triage many records at once (screening campaigns); results are in request order"""
+    records = [
+        (record.symptoms, record.vitals.model_dump() if record.vitals else None)
+        for record in payload.records
+    ]
+    results = await run_in_threadpool(engine.assess_batch, records)
+    audit_log("TRIAGE_ASSESS_BATCH", current_user["id"], {
+        "records": len(results),
+        "urgency": dict(Counter(result["urgency"] for result in results))
+    })
+    return {"results": results}
+
 @router.get("/decision-tree")
-async def decision_tree(current_user: dict = Depends(get_current_user)):
-    """Expose a minimal decision tree structure for offline use."""
-    tree = {
-        "question": "Is patient conscious?",
-        "yes": {
-            "question": "Is there chest pain or severe shortness of breath?",
-            "yes": {"urgency": "emergency", "recommend": "cardiology/pulmonology"},
-            "no": {
-                "question": "Is fever >= 39.5C or SBP >= 180?",
-                "yes": {"urgency": "urgent", "recommend": "general medicine"},
-                "no": {"urgency": "routine", "recommend": "general medicine"}
-            }
-        },
-        "no": {"urgency": "emergency", "recommend": "emergency medicine"}
-    }
-    return tree
+async def decision_tree(request: Request, current_user: dict = Depends(get_current_user)):
+    """Decision tree for offline use, generated from the same rule plan as /assess.
 
+    Served pre-serialised with an ETag tied to the rule version and file content; clients
+    revalidate with If-None-Match.
+    """
+    plan = engine.plan()
+    return cached_json_response(request, "triage.decision_tree", None, plan.version, lambda: engine.decision_tree(plan))
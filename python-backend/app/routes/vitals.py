@@ -0,0 +1,130 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+import math
+import os
+
+from ..middleware.auth_middleware import get_current_user, audit_log
+from ..database_enhanced import get_db, Patient, Consultation, PatientVitalsState
+from ..services.vitals_service import VitalsService
+
+router = APIRouter()
+
+MAX_READINGS_PER_BATCH = int(os.getenv("VITALS_MAX_BATCH_READINGS", "5000"))
+MAX_POINTS = 2000
+
+class VitalReading(BaseModel):
+    patientId: int
+    timestamp: datetime = Field(..., description="ISO timestamp; naive values are taken as UTC")
+    heartRate: Optional[float] = None
+    spo2: Optional[float] = None
+    systolic: Optional[float] = None
+    diastolic: Optional[float] = None
+    temperature: Optional[float] = None
+    respRate: Optional[float] = None
+    supplementalO2: Optional[bool] = None
+    consciousnessAltered: Optional[bool] = None
+
+class VitalsBatch(BaseModel):
+    readings: List[VitalReading] = Field(..., min_length=1, max_length=MAX_READINGS_PER_BATCH)
+
+def _utc(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _authorize_patient_access(patient_id: int, current_user: dict, db: Session):
+    """Patients may access their own vitals; doctors only those of patients they have consulted"""
+    role = current_user.get("role")
+    if role == "patient":
+        patient = db.query(Patient).filter(Patient.user_id == current_user["id"]).first()
+        if not patient or patient.id != patient_id:
+            raise HTTPException(status_code=403, detail="Not authorized to access these vitals")
+    elif role == "doctor":
+        consulted = db.query(Consultation).filter(
+            Consultation.patient_id == patient_id,
+            Consultation.doctor_id == current_user["id"]
+        ).first()
+        if not consulted:
+            audit_log("UNAUTHORIZED_VITALS_ACCESS", current_user["id"], {
+                "patient_id": patient_id,
+                "reason": "no_consultation_history"
+            })
+            raise HTTPException(status_code=403, detail="Access denied: No consultation history with this patient")
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized to access these vitals")
+
+@router.post("/readings")
+async def ingest_readings(
+    batch: VitalsBatch,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Store a batch of device readings (any number of patients) and update each patient's NEWS2"""
+    by_patient = defaultdict(list)
+    for reading in batch.readings:
+        vitals = reading.model_dump(exclude={"patientId", "timestamp"})
+        by_patient[reading.patientId].append((_utc(reading.timestamp), vitals))
+
+    for patient_id in by_patient:
+        _authorize_patient_access(patient_id, current_user, db)
+
+    results = []
+    try:
+        for patient_id, readings in sorted(by_patient.items()):
+            days = VitalsService.store_readings(db, patient_id, readings)
+            state = VitalsService.update_state(db, patient_id, readings)
+            results.append({
+                "patientId": patient_id,
+                "stored": len(readings),
+                "days": days,
+                "news2Score": state.news2_score,
+                "news2Risk": state.news2_risk
+            })
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    audit_log("VITALS_INGESTED", current_user["id"], {
+        "patients": sorted(by_patient),
+        "readings": len(batch.readings)
+    })
+    return {"results": results}
+
+@router.get("/patient/{patient_id}")
+async def get_vitals_range(
+    patient_id: int,
+    start: Optional[datetime] = Query(None, description="Range start (default: 24 hours before end)"),
+    end: Optional[datetime] = Query(None, description="Range end (default: now)"),
+    bucket: Optional[int] = Query(None, ge=1, description="Bucket width in seconds for downsampling"),
+    max_points: int = Query(500, ge=1, le=MAX_POINTS),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Vitals over a time range, averaged into buckets so at most max_points are returned"""
+    _authorize_patient_access(patient_id, current_user, db)
+
+    end = _utc(end) if end else datetime.utcnow()
+    start = _utc(start) if start else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    span = (end - start).total_seconds()
+    bucket_seconds = max(bucket or 1, math.ceil(span / max_points))
+
+    audit_log("VITALS_ACCESS", current_user["id"], {"patientId": patient_id})
+    return VitalsService.query_range(db, patient_id, start, end, bucket_seconds)
+
+@router.get("/patient/{patient_id}/news2")
+async def get_news2(
+    patient_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Current NEWS2 early-warning score and the latest observation of each vital"""
+    _authorize_patient_access(patient_id, current_user, db)
+    state = db.query(PatientVitalsState).filter(PatientVitalsState.patient_id == patient_id).first()
+    return VitalsService.state_summary(state)
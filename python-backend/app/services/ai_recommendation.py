@@ -1,6 +1,27 @@
-from typing import List, Dict, Optional
+import os
+from typing import List, Dict, NamedTuple, Optional, Tuple
+import numpy as np
 from sqlalchemy.orm import Session
-from ..database_enhanced import DoctorProfile, User, Patient, MedicalFile
+from ..cache import TTLCache
+from ..database_enhanced import Patient
+from .doctor_directory import doctor_directory, doctor_load
+from .keyword_matcher import clinical_matcher, register_vocabulary
+
+# Load-independent candidate scores per (patient id, matched conditions, directory snapshot
+# version). Entries are dropped when the patient's profile or OCR features change, and a directory
+# reload moves to a new version. Doctor load changes with every booking, so the load penalty and
+# currentLoad are applied to the cached scores on each request instead.
+recommendation_cache = TTLCache(
+    maxsize=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "120"))
+)
+
+class CandidateScores(NamedTuple):
+    """Record positions in a directory snapshot that may be recommended, with their scores before load"""
+    snapshot: object
+    positions: np.ndarray
+    scores: np.ndarray
+
 
 class AIRecommendationService:
     
@@ -13,75 +34,163 @@ class AIRecommendationService:
         'cancer': ['oncology'], 'headache': ['neurology'], 'child': ['pediatrics']
     }
     
+    # Each open (scheduled / accepted) consultation costs this many points, up to the cap, so
+    # equally qualified but less busy doctors rank first
+    LOAD_PENALTY_PER_CONSULTATION = 2
+    MAX_LOAD_PENALTY = 10
+    
     @staticmethod
-    def recommend_doctors(
+    def extract_clinical_features(text: str) -> Tuple[List[str], List[str]]:
+        """Return the (conditions, specialties) mentioned in free text, each sorted and de-duplicated"""
+        conditions = set()
+        specialties = set()
+        for term in clinical_matcher().find_terms(text):
+            specs = AIRecommendationService.CONDITION_SPECIALTY_MAP.get(term)
+            if specs:
+                conditions.add(term)
+                specialties.update(specs)
+        return sorted(conditions), sorted(specialties)
+    
+    @staticmethod
+    def combined_text(patient_symptoms: Optional[str], patient_medical_history: Optional[List[str]]) -> str:
+        return (patient_symptoms or "") + " " + " ".join(patient_medical_history or [])
+    
+    @staticmethod
+    def cache_key(
+        patient_id: int, symptoms: Optional[str], medical_history: Optional[List[str]], snapshot
+    ) -> Tuple[int, Tuple[str, ...], int]:
+        # Symptoms only affect the result through the conditions the matcher finds in the text that
+        # candidate_scores analyses, so key on exactly those
+        conditions, _ = AIRecommendationService.extract_clinical_features(
+            AIRecommendationService.combined_text(symptoms, medical_history)
+        )
+        return patient_id, tuple(conditions), snapshot.version
+    
+    @staticmethod
+    def invalidate_patient(patient_id: int):
+        recommendation_cache.invalidate(lambda key: key[0] == patient_id)
+    
+    @staticmethod
+    def invalidate_all():
+        recommendation_cache.invalidate()
+    
+    @staticmethod
+    def base_scores(snapshot, relevant_specialties: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(candidate positions, scores before load) for a directory snapshot.
+
+        Vectorised over the snapshot's column arrays:
+        10 base + 20 specialty match + experience bucket (15/12/8/5) + 3 per certification (max 9).
+        """
+        if relevant_specialties:
+            key_match = doctor_directory.specialty_key_mask(snapshot, relevant_specialties)
+            specialty_match = key_match[snapshot.specialty_ids]
+            candidates = np.flatnonzero(specialty_match)
+        else:
+            specialty_match = np.zeros(len(snapshot.records), dtype=bool)
+            candidates = np.arange(len(snapshot.records))
+
+        years = snapshot.years[candidates]
+        scores = (
+            10
+            + 20 * specialty_match[candidates]
+            + np.select([years >= 15, years >= 10, years >= 5], [15, 12, 8], 5)
+            + np.minimum(snapshot.cert_counts[candidates] * 3, 9)
+        ).astype(np.int64)
+        return candidates, scores
+    
+    @staticmethod
+    def rank(
+        snapshot, candidates: np.ndarray, base_scores: np.ndarray, limit: int,
+        loads: Optional[Dict[int, int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Top (position, score) pairs after subtracting 2 per open consultation (max 10).
+
+        loads is keyed by doctor user id. Ties keep directory (user id) order, i.e. the same
+        result as a stable sort of all scores.
+        """
+        if candidates.size == 0 or limit <= 0:
+            return []
+        scores = base_scores
+        if loads:
+            open_counts = np.fromiter(
+                (loads.get(doctor_id, 0) for doctor_id in snapshot.ids[candidates].tolist()),
+                dtype=np.int64, count=candidates.size
+            )
+            scores = scores - np.minimum(
+                open_counts * AIRecommendationService.LOAD_PENALTY_PER_CONSULTATION,
+                AIRecommendationService.MAX_LOAD_PENALTY
+            )
+
+        # Scores are small integers, so (score, -position) packs into one exactly comparable key
+        n = len(snapshot.records)
+        keys = scores * n + (n - 1 - candidates)
+        if candidates.size > limit:
+            top = np.argpartition(-keys, limit - 1)[:limit]
+        else:
+            top = np.arange(candidates.size)
+        top = top[np.argsort(-keys[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+    
+    @staticmethod
+    def score_doctors(
+        snapshot, relevant_specialties: List[str], limit: int, loads: Optional[Dict[int, int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Score the candidate doctors in a directory snapshot and return the top (position, score) pairs"""
+        candidates, scores = AIRecommendationService.base_scores(snapshot, relevant_specialties)
+        return AIRecommendationService.rank(snapshot, candidates, scores, limit, loads)
+    
+    @staticmethod
+    def candidate_scores(
         db: Session, patient_symptoms: str, patient_medical_history: List[str],
-        patient_id: Optional[int] = None, limit: int = 5
-    ) -> List[Dict]:
+        patient_id: Optional[int] = None, snapshot=None
+    ) -> CandidateScores:
+        """The load-independent part of a recommendation; cacheable until the directory reloads"""
         
         # Extract specialties from symptoms and history
-        relevant_specialties = []
-        combined_text = (patient_symptoms + " " + " ".join(patient_medical_history or [])).lower()
+        combined_text = AIRecommendationService.combined_text(patient_symptoms, patient_medical_history)
+        _, relevant_specialties = AIRecommendationService.extract_clinical_features(combined_text)
         
-        for condition, specs in AIRecommendationService.CONDITION_SPECIALTY_MAP.items():
-            if condition in combined_text:
-                relevant_specialties.extend(specs)
-        
-        # Get OCR context from patient files
+        # OCR context: specialties were extracted once when each file was OCR'd and rolled up
+        # onto the patient, so this is a single small array read regardless of document size
         if patient_id:
-            files = db.query(MedicalFile).filter(
-                MedicalFile.patient_id == patient_id,
-                MedicalFile.ocr_text.isnot(None)
-            ).limit(3).all()
-            ocr_text = " ".join([f.ocr_text for f in files if f.ocr_text]).lower()
-            
-            for condition, specs in AIRecommendationService.CONDITION_SPECIALTY_MAP.items():
-                if condition in ocr_text:
-                    relevant_specialties.extend(specs)
-        
-        relevant_specialties = list(set(relevant_specialties))
-        
-        # Query doctors
-        query = db.query(DoctorProfile, User).join(User, DoctorProfile.user_id == User.id)
-        query = query.filter(User.role == "doctor", DoctorProfile.verification_status == "verified")
-        
-        if relevant_specialties:
-            filters = [DoctorProfile.primary_specialization.ilike(f"%{spec}%") for spec in relevant_specialties]
-            from sqlalchemy import or_
-            query = query.filter(or_(*filters))
+            ocr_specialties = db.query(Patient.clinical_specialties).filter(Patient.id == patient_id).scalar()
+            relevant_specialties.extend(ocr_specialties or [])
         
-        doctors = query.all()
-        
-        # Score doctors
+        snapshot = snapshot or doctor_directory.snapshot()
+        candidates, scores = AIRecommendationService.base_scores(snapshot, list(set(relevant_specialties)))
+        return CandidateScores(snapshot, candidates, scores)
+    
+    @staticmethod
+    def recommendations(candidates: CandidateScores, limit: int = 5) -> List[Dict]:
+        """Rank candidates under the current doctor load"""
+        snapshot = candidates.snapshot
+        loads = doctor_load.counts()
         scored_doctors = []
-        for profile, user in doctors:
-            score = 10.0  # Base score
-            
-            # Specialty match
-            primary_spec = (profile.primary_specialization or "").lower()
-            for spec in relevant_specialties:
-                if spec in primary_spec:
-                    score += 20
-                    break
-            
-            # Experience score
-            years = profile.years_of_practice or 0
-            if years >= 15: score += 15
-            elif years >= 10: score += 12
-            elif years >= 5: score += 8
-            else: score += 5
-            
-            # Certifications
-            score += min(len(profile.board_certifications or []) * 3, 9)
-            
+        for position, score in AIRecommendationService.rank(
+            snapshot, candidates.positions, candidates.scores, limit, loads
+        ):
+            doctor = snapshot.records[position]
+            years = doctor.years_of_practice
+            primary_spec = (doctor.specialization or "").lower()
             scored_doctors.append({
-                "id": user.id, "name": user.name, "email": user.email,
-                "specialization": profile.primary_specialization,
-                "yearsOfPractice": years, "telemedicineStates": profile.telemedicine_states or [],
-                "boardCertifications": profile.board_certifications or [],
+                "id": doctor.id, "name": doctor.name, "email": doctor.email,
+                "specialization": doctor.specialization,
+                "yearsOfPractice": years, "telemedicineStates": list(doctor.telemedicine_states),
+                "boardCertifications": list(doctor.board_certifications),
+                "currentLoad": loads.get(doctor.id, 0),
                 "score": score, "isAiRecommended": True,
                 "matchReason": f"{primary_spec.title()} specialist with {years} years experience"
             })
-        
-        scored_doctors.sort(key=lambda x: x["score"], reverse=True)
-        return scored_doctors[:limit]
\ No newline at end of file
+        return scored_doctors
+    
+    @staticmethod
+    def recommend_doctors(
+        db: Session, patient_symptoms: str, patient_medical_history: List[str],
+        patient_id: Optional[int] = None, limit: int = 5
+    ) -> List[Dict]:
+        candidates = AIRecommendationService.candidate_scores(
+            db, patient_symptoms, patient_medical_history, patient_id
+        )
+        return AIRecommendationService.recommendations(candidates, limit)
+
+register_vocabulary("ai_recommendation.conditions", AIRecommendationService.CONDITION_SPECIALTY_MAP)
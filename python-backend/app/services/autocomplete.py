@@ -0,0 +1,134 @@
+from bisect import bisect_left
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .knowledge_index import normalize_key
+
+# Fuzzy matching compares the first FUZZY_PREFIX characters of the query with the same number of
+# characters of each term, allowing more edits as the query grows (0 below 3 characters, 1 up to
+# 5, 2 from 6), the same budget search engines use for as-you-type correction
+FUZZY_PREFIX = 6
+MIN_FUZZY_LENGTH = 3
+
+
+def edit_budget(length: int) -> int:
+    if length < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if length < FUZZY_PREFIX else 2
+
+
+def _deletes(text: str, max_edits: int) -> Set[str]:
+    """text with up to max_edits characters removed (the symmetric-delete neighbourhood)"""
+    out = {text}
+    for n in range(1, min(max_edits, len(text) - 1) + 1):
+        for drop in combinations(range(len(text)), n):
+            out.add("".join(ch for i, ch in enumerate(text) if i not in drop))
+    return out
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal-string-alignment distance (adjacent swaps count once); stops early past limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class Autocompleter:
+    """Prefix and typo-tolerant suggestions over a fixed vocabulary.
+
+    Terms are kept as a sorted array of normalised keys: every key with a given prefix is a
+    contiguous run found by binary search, which is what walking a prefix trie returns, without
+    the per-node objects. Typos are handled SymSpell-style: the delete neighbourhood of each
+    key's leading characters is indexed once, so a lookup generates the query's (few) deletes
+    and verifies only the keys that share one.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, Optional[str]]]):
+        """entries: (label, type, canonical name or None)"""
+        by_key: Dict[str, List[dict]] = {}
+        for label, kind, canonical in entries:
+            key = normalize_key(label)
+            if not key:
+                continue
+            suggestion = {"text": label, "type": kind}
+            if canonical and normalize_key(canonical) != key:
+                suggestion["canonical"] = canonical
+            # One suggestion per key and type ("Malaria" the guideline and the symptom-rule condition)
+            if not any(s["type"] == kind for s in by_key.setdefault(key, [])):
+                by_key[key].append(suggestion)
+        self.keys: List[str] = sorted(by_key)
+        self.suggestions: List[List[dict]] = [by_key[key] for key in self.keys]
+
+        deletes: Dict[str, List[int]] = {}
+        for position, key in enumerate(self.keys):
+            for length in range(MIN_FUZZY_LENGTH, min(len(key), FUZZY_PREFIX) + 1):
+                for variant in _deletes(key[:length], edit_budget(length)):
+                    deletes.setdefault(variant, []).append(position)
+        self._deletes = deletes
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _prefix_positions(self, prefix: str, cap: int) -> List[int]:
+        start = bisect_left(self.keys, prefix)
+        positions = []
+        for position in range(start, len(self.keys)):
+            if not self.keys[position].startswith(prefix) or len(positions) >= cap:
+                break
+            positions.append(position)
+        return positions
+
+    def _fuzzy_positions(self, query: str) -> List[Tuple[int, int]]:
+        """(distance, position) of keys whose leading characters are within the edit budget of the query's"""
+        head = query[:FUZZY_PREFIX]
+        budget = edit_budget(len(head))
+        if not budget:
+            return []
+        candidates = set()
+        for variant in _deletes(head, budget):
+            candidates.update(self._deletes.get(variant, ()))
+        found = []
+        for position in candidates:
+            distance = edit_distance(head, self.keys[position][:len(head)], budget)
+            if distance <= budget:
+                found.append((distance, position))
+        return found
+
+    def suggest(self, query: str, limit: int = 10, types: Optional[Sequence[str]] = None) -> List[dict]:
+        """Up to limit suggestions: exact and prefix matches (shortest first), then typo matches"""
+        query = normalize_key(query)
+        if not query:
+            return []
+        wanted = set(types) if types else None
+        results: List[dict] = []
+        seen: Set[int] = set()
+
+        def take(positions: Iterable[int], match: str):
+            for position in positions:
+                if position in seen:
+                    continue
+                seen.add(position)
+                for suggestion in self.suggestions[position]:
+                    if wanted is None or suggestion["type"] in wanted:
+                        results.append({**suggestion, "match": match})
+                        if len(results) >= limit:
+                            return
+
+        # Over-fetch the prefix run so short, common completions rank ahead of long ones
+        prefix = sorted(self._prefix_positions(query, cap=limit * 20), key=lambda p: (len(self.keys[p]), self.keys[p]))
+        take(prefix, "prefix")
+        if len(results) < limit:
+            fuzzy = sorted(self._fuzzy_positions(query), key=lambda dp: (dp[0], len(self.keys[dp[1]]), self.keys[dp[1]]))
+            take((position for _, position in fuzzy), "fuzzy")
+        return results[:limit]
@@ -0,0 +1,209 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ..database_enhanced import SessionLocal, Consultation
+from .text_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+# Completed consultations recorded by other worker processes are picked up by a full reload
+# after this many seconds
+CASE_SIMILARITY_TTL = int(os.getenv("CASE_SIMILARITY_TTL", "900"))
+# Cases folded in since the last build are served from the previous matrix until this many have
+# accumulated or the matrix is this many seconds old, so a busy clinic does not rebuild per completion
+REBUILD_BATCH = int(os.getenv("CASE_SIMILARITY_REBUILD_BATCH", "200"))
+REBUILD_INTERVAL = float(os.getenv("CASE_SIMILARITY_REBUILD_SECONDS", "60"))
+
+
+class _CaseProfiles:
+    """Term counts per completed case and per doctor, from which the matrix is built"""
+
+    def __init__(self):
+        self.case_terms: Dict[int, Tuple[int, Counter]] = {}  # consultation id -> (doctor id, term counts)
+        self.doctor_terms: Dict[int, Counter] = {}
+        self.doctor_cases: Counter = Counter()
+        self.document_frequency: Counter = Counter()
+
+    def remove(self, consultation_id: int) -> bool:
+        previous = self.case_terms.pop(consultation_id, None)
+        if previous is None:
+            return False
+        doctor_id, terms = previous
+        self.doctor_terms[doctor_id].subtract(terms)
+        self.doctor_terms[doctor_id] += Counter()  # drop zero counts
+        self.doctor_cases[doctor_id] -= 1
+        self.document_frequency.subtract(terms.keys())
+        self.document_frequency += Counter()
+        return True
+
+    def add(self, consultation_id: int, doctor_id: int, text: str) -> bool:
+        """Fold a case in, replacing any earlier version of it; True if the profiles changed"""
+        changed = self.remove(consultation_id)
+        terms = Counter(tokenize(text))
+        if not terms:
+            return changed
+        self.case_terms[consultation_id] = (doctor_id, terms)
+        self.doctor_terms.setdefault(doctor_id, Counter()).update(terms)
+        self.doctor_cases[doctor_id] += 1
+        self.document_frequency.update(terms.keys())
+        return True
+
+
+class CaseSimilarityIndex:
+    """TF-IDF profile of the cases each doctor has completed, for "who has handled this before" queries.
+
+    Completed consultations (symptoms + diagnosis) are folded into per-doctor term accumulators
+    as they complete; the doctor x term CSR matrix is re-materialised from the accumulators once
+    REBUILD_BATCH cases or REBUILD_INTERVAL seconds have accumulated, never by rescanning the
+    database. The whole index is reloaded from the database after CASE_SIMILARITY_TTL. Scoring
+    is one sparse matrix-vector product of L2-normalised rows against the query vector (cosine
+    similarity).
+    """
+
+    def __init__(self, ttl: int = CASE_SIMILARITY_TTL, rebuild_batch: int = REBUILD_BATCH,
+                 rebuild_interval: float = REBUILD_INTERVAL):
+        self.ttl = ttl
+        self.rebuild_batch = rebuild_batch
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()  # guards the profiles and the built matrix
+        self._load_lock = threading.Lock()  # one database load at a time
+        self._profiles: Optional[_CaseProfiles] = None
+        self._loaded_at = 0.0
+        # Cases completed while a load is reading the database, replayed onto its result
+        self._recent: Optional[List[Tuple[int, int, str]]] = None
+        self._pending = 0  # profile changes not yet in the matrix
+        self._built_at = 0.0
+        self._matrix: Optional[csr_matrix] = None
+        self._vocabulary: Dict[str, int] = {}
+        self._idf: Optional[np.ndarray] = None
+        self._doctor_ids: List[int] = []
+        self._case_counts: Dict[int, int] = {}
+
+    @staticmethod
+    def _case_text(symptoms: Optional[str], diagnosis: Optional[str]) -> str:
+        return f"{symptoms or ''} {diagnosis or ''}"
+
+    def load(self):
+        with self._lock:
+            self._recent = []
+        profiles = _CaseProfiles()
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Consultation.id, Consultation.doctor_id, Consultation.symptoms, Consultation.diagnosis)
+                .filter(Consultation.status == "completed", Consultation.doctor_id.isnot(None))
+                .yield_per(1000)
+            )
+            for consultation_id, doctor_id, symptoms, diagnosis in rows:
+                profiles.add(consultation_id, doctor_id, self._case_text(symptoms, diagnosis))
+        except Exception:
+            with self._lock:
+                self._recent = None
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            for case in self._recent:
+                profiles.add(*case)
+            self._recent = None
+            self._profiles = profiles
+            self._loaded_at = time.monotonic()
+            self._build()
+        logger.info(f"Case similarity index loaded {len(profiles.case_terms)} completed consultations")
+
+    def _ensure_loaded(self):
+        if self._profiles is not None and time.monotonic() - self._loaded_at <= self.ttl:
+            return
+        with self._load_lock:
+            if self._profiles is None or time.monotonic() - self._loaded_at > self.ttl:
+                self.load()
+
+    def add_case(self, consultation_id: int, doctor_id: Optional[int], symptoms: Optional[str], diagnosis: Optional[str]):
+        """Fold a completed consultation in (or refresh it if it was already indexed)"""
+        if doctor_id is None:
+            return
+        case = (consultation_id, doctor_id, self._case_text(symptoms, diagnosis))
+        with self._lock:
+            if self._recent is not None:
+                self._recent.append(case)
+            if self._profiles is None:
+                return  # the initial load will read it from the database (or replay it)
+            if self._profiles.add(*case):
+                self._pending += 1
+
+    def _needs_build(self) -> bool:
+        if self._matrix is None:
+            return True
+        return self._pending > 0 and (
+            self._pending >= self.rebuild_batch or time.monotonic() - self._built_at >= self.rebuild_interval
+        )
+
+    def _build(self):
+        profiles = self._profiles
+        vocabulary = {term: i for i, term in enumerate(profiles.document_frequency)}
+        n_cases = len(profiles.case_terms)
+        idf = np.zeros(len(vocabulary), dtype=np.float64)
+        for term, i in vocabulary.items():
+            idf[i] = math.log((1 + n_cases) / (1 + profiles.document_frequency[term])) + 1
+
+        doctor_ids = sorted(d for d, terms in profiles.doctor_terms.items() if terms)
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for doctor_id in doctor_ids:
+            for term, count in profiles.doctor_terms[doctor_id].items():
+                indices.append(vocabulary[term])
+                data.append(count)
+            indptr.append(len(indices))
+        matrix = csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(doctor_ids), len(vocabulary))
+        )
+        matrix = matrix.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix = csr_matrix(matrix.multiply(1.0 / norms[:, None]))
+
+        self._vocabulary = vocabulary
+        self._idf = idf
+        self._doctor_ids = doctor_ids
+        self._case_counts = dict(profiles.doctor_cases)
+        self._matrix = matrix
+        self._built_at = time.monotonic()
+        self._pending = 0
+
+    def similar_doctors(self, text: str, limit: int = 5) -> List[Tuple[int, float, int]]:
+        """(doctor id, cosine similarity, completed case count) for the doctors whose past cases best match text"""
+        self._ensure_loaded()
+        with self._lock:
+            if self._needs_build():
+                self._build()
+            matrix, vocabulary, idf, doctor_ids = self._matrix, self._vocabulary, self._idf, self._doctor_ids
+            case_counts = self._case_counts
+
+        query_terms = Counter(t for t in tokenize(text) if t in vocabulary)
+        if not query_terms or matrix.shape[0] == 0:
+            return []
+        columns = np.fromiter((vocabulary[t] for t in query_terms), dtype=np.int32, count=len(query_terms))
+        weights = np.fromiter(query_terms.values(), dtype=np.float64, count=len(query_terms)) * idf[columns]
+        weights /= np.linalg.norm(weights)
+
+        # Sparse matrix-vector product restricted to the query's columns
+        scores = matrix[:, columns] @ weights
+        nonzero = np.flatnonzero(scores > 0)
+        if nonzero.size > limit:
+            nonzero = nonzero[np.argpartition(-scores[nonzero], limit - 1)[:limit]]
+        ranked = nonzero[np.lexsort((nonzero, -scores[nonzero]))]
+        return [(doctor_ids[i], float(scores[i]), case_counts.get(doctor_ids[i], 0)) for i in ranked]
+
+
+case_similarity = CaseSimilarityIndex()
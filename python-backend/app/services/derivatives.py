@@ -0,0 +1,163 @@
+import io
+import logging
+import os
+from typing import Dict, Mapping, Optional
+
+from PIL import Image, ImageOps
+from pdf2image import convert_from_path
+
+from .file_encryption import open_stored_file, decrypted_copy, write_encrypted_bytes, stored_file_size
+from .dicom_service import DicomService
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_DIR = "derivatives"
+
+# Longest edge in pixels for each preview size
+PREVIEW_SIZES: Dict[str, int] = {"thumb": 128, "small": 256, "medium": 512}
+PREVIEW_QUALITY = 70
+
+# Download tiers for images: (longest edge, WebP quality). "original" bypasses transcoding.
+TRANSCODE_TIERS: Dict[str, tuple] = {"low": (800, 45), "medium": (1600, 65), "high": (2560, 80)}
+ORIGINAL_TIER = "original"
+
+IMAGE_TYPES = {".jpg", ".jpeg", ".png"}
+PREVIEWABLE_TYPES = IMAGE_TYPES | {".pdf", ".dcm"}
+
+
+class DerivativeService:
+    """Thumbnails and first-page previews, cached on disk by content hash.
+
+    Derivatives are stored encrypted like the originals, and because the cache key is
+    the plaintext SHA-256, duplicate uploads share one set of previews.
+    """
+
+    @staticmethod
+    def cache_path(content_hash: str, variant: str) -> str:
+        return os.path.join(DERIVATIVE_DIR, content_hash[:2], f"{content_hash}-{variant}.webp")
+
+    @staticmethod
+    def get_cached(content_hash: str, variant: str) -> Optional[bytes]:
+        path = DerivativeService.cache_path(content_hash, variant)
+        if not os.path.exists(path):
+            return None
+        with open_stored_file(path) as fh:
+            return fh.read()
+
+    @staticmethod
+    def store(content_hash: str, variant: str, data: bytes):
+        path = DerivativeService.cache_path(content_hash, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_encrypted_bytes(path, data)
+
+    @staticmethod
+    def encode_webp(image: Image.Image, max_edge: int, quality: int = PREVIEW_QUALITY) -> bytes:
+        preview = image.copy()
+        preview.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if preview.mode not in ("RGB", "RGBA", "L"):
+            preview = preview.convert("RGB")
+        out = io.BytesIO()
+        preview.save(out, format="WEBP", quality=quality, method=4)
+        return out.getvalue()
+
+    @staticmethod
+    def load_source_image(file_path: str, file_type: str, max_edge: int) -> Optional[Image.Image]:
+        """Decode just enough of the original to render a preview of max_edge pixels"""
+        if file_type in IMAGE_TYPES:
+            with open_stored_file(file_path) as fh:
+                image = Image.open(fh)
+                # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, skipping most of the work
+                image.draft("RGB", (max_edge, max_edge))
+                image = ImageOps.exif_transpose(image)
+                image.load()
+                return image
+        if file_type == ".pdf":
+            with decrypted_copy(file_path) as plain_path:
+                pages = convert_from_path(plain_path, first_page=1, last_page=1, size=max_edge)
+            return pages[0] if pages else None
+        if file_type == ".dcm":
+            return DicomService.render_frame(file_path, 0)
+        return None
+
+    @staticmethod
+    def generate_previews(file_path: str, file_type: str, content_hash: str):
+        """Render every preview size for a file; meant to run as a background task"""
+        if file_type not in PREVIEWABLE_TYPES or not content_hash:
+            return
+        missing = {
+            variant: edge for variant, edge in PREVIEW_SIZES.items()
+            if not os.path.exists(DerivativeService.cache_path(content_hash, variant))
+        }
+        if not missing:
+            return
+        try:
+            source = DerivativeService.load_source_image(file_path, file_type, max(missing.values()))
+            if source is None:
+                return
+            for variant, edge in missing.items():
+                DerivativeService.store(content_hash, variant, DerivativeService.encode_webp(source, edge))
+        except Exception as e:
+            logger.warning(f"Preview generation failed for {file_path}: {str(e)}")
+
+    @staticmethod
+    def get_preview(file_path: str, file_type: str, content_hash: str, variant: str) -> Optional[bytes]:
+        """Return a cached preview, rendering it on demand if the background job has not run yet"""
+        cached = DerivativeService.get_cached(content_hash, variant)
+        if cached is not None:
+            return cached
+        DerivativeService.generate_previews(file_path, file_type, content_hash)
+        return DerivativeService.get_cached(content_hash, variant)
+
+    @staticmethod
+    def get_dicom_frame(file_path: str, content_hash: str, frame: int, variant: str) -> bytes:
+        """WebP render of one DICOM frame; only that frame is decoded"""
+        cache_variant = f"f{frame}-{variant}"
+        cached = DerivativeService.get_cached(content_hash, cache_variant)
+        if cached is None:
+            image = DicomService.render_frame(file_path, frame)
+            cached = DerivativeService.encode_webp(image, PREVIEW_SIZES[variant])
+            DerivativeService.store(content_hash, cache_variant, cached)
+        return cached
+
+    @staticmethod
+    def select_tier(quality: Optional[str], headers: Mapping[str, str]) -> str:
+        """Pick a download tier from an explicit quality parameter or the client's network hints"""
+        if quality:
+            return quality
+        if headers.get("save-data", "").lower() == "on":
+            return "low"
+        ect = headers.get("ect", "").lower()
+        if ect in ("slow-2g", "2g"):
+            return "low"
+        if ect == "3g":
+            return "medium"
+        try:
+            downlink = float(headers.get("downlink", ""))
+        except ValueError:
+            return ORIGINAL_TIER
+        if downlink < 0.5:
+            return "low"
+        if downlink < 2:
+            return "medium"
+        return ORIGINAL_TIER
+
+    @staticmethod
+    def get_transcoded(file_path: str, file_type: str, content_hash: str, tier: str) -> Optional[bytes]:
+        """WebP rendition of an image for the given tier, or None if the original should be sent.
+
+        Renditions that would not be smaller than the original are not used.
+        """
+        if file_type not in IMAGE_TYPES or tier not in TRANSCODE_TIERS or not content_hash:
+            return None
+        variant = f"t-{tier}"
+        cached = DerivativeService.get_cached(content_hash, variant)
+        if cached is None:
+            max_edge, quality = TRANSCODE_TIERS[tier]
+            source = DerivativeService.load_source_image(file_path, file_type, max_edge)
+            if source is None:
+                return None
+            cached = DerivativeService.encode_webp(source, max_edge, quality)
+            DerivativeService.store(content_hash, variant, cached)
+        if len(cached) >= stored_file_size(file_path):
+            return None
+        return cached
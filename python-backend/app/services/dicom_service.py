@@ -0,0 +1,97 @@
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from PIL import Image
+
+from .file_encryption import open_stored_file
+
+try:
+    import numpy as np
+    import pydicom
+    from pydicom.pixels import pixel_array, apply_modality_lut, apply_voi_lut
+except Exception:
+    pydicom = None
+
+logger = logging.getLogger(__name__)
+
+
+def _text(ds, keyword: str) -> Optional[str]:
+    value = ds.get(keyword)
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _parse_dicom_date(value) -> Optional[date]:
+    try:
+        return datetime.strptime(str(value), "%Y%m%d").date() if value else None
+    except ValueError:
+        return None
+
+
+class DicomService:
+    """Header indexing and lazy frame rendering for DICOM uploads.
+
+    Only the header is parsed at upload time; pixel data is decoded one frame at a time,
+    straight from the (encrypted) stored file, so multi-frame series never sit in memory whole.
+    """
+
+    @staticmethod
+    def available() -> bool:
+        return pydicom is not None
+
+    @staticmethod
+    def read_metadata(file_path: str) -> Optional[dict]:
+        """Parse the DICOM header (stopping before pixel data) into indexable fields"""
+        if pydicom is None:
+            return None
+        try:
+            with open_stored_file(file_path) as fh:
+                ds = pydicom.dcmread(fh, stop_before_pixels=True, force=True)
+        except Exception as e:
+            logger.warning(f"DICOM header parse failed for {file_path}: {str(e)}")
+            return None
+        return {
+            "modality": _text(ds, "Modality"),
+            "study_date": _parse_dicom_date(ds.get("StudyDate")),
+            "body_part": _text(ds, "BodyPartExamined"),
+            "study_uid": _text(ds, "StudyInstanceUID"),
+            "study_description": _text(ds, "StudyDescription"),
+            "series_description": _text(ds, "SeriesDescription"),
+            "number_of_frames": int(ds.get("NumberOfFrames") or 1),
+            "rows": ds.get("Rows"),
+            "columns": ds.get("Columns"),
+        }
+
+    @staticmethod
+    def apply_metadata(medical_file, meta: dict):
+        """Copy parsed header fields onto the indexed MedicalFile columns"""
+        medical_file.dicom_modality = meta["modality"]
+        medical_file.dicom_study_date = meta["study_date"]
+        medical_file.dicom_body_part = meta["body_part"]
+        medical_file.dicom_study_uid = meta["study_uid"]
+        medical_file.dicom_frame_count = meta["number_of_frames"]
+
+    @staticmethod
+    def render_frame(file_path: str, index: int = 0) -> Optional[Image.Image]:
+        """Decode a single frame and window it to an 8-bit image"""
+        if pydicom is None:
+            return None
+        with open_stored_file(file_path) as fh:
+            ds = pydicom.dcmread(fh, stop_before_pixels=True, force=True)
+            frames = int(ds.get("NumberOfFrames") or 1)
+            if index < 0 or index >= frames:
+                raise IndexError(f"Frame {index} out of range (0-{frames - 1})")
+            fh.seek(0)
+            arr = pixel_array(fh, index=index)
+
+        if ds.get("SamplesPerPixel", 1) > 1:
+            return Image.fromarray(arr.astype(np.uint8), mode="RGB")
+
+        arr = apply_voi_lut(apply_modality_lut(arr, ds), ds).astype(np.float32)
+        lo, hi = float(arr.min()), float(arr.max())
+        scaled = (arr - lo) * (255.0 / (hi - lo)) if hi > lo else np.zeros_like(arr)
+        if ds.get("PhotometricInterpretation") == "MONOCHROME1":
+            scaled = 255.0 - scaled
+        return Image.fromarray(scaled.astype(np.uint8), mode="L")
@@ -0,0 +1,262 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sqlalchemy import func
+
+from ..database_enhanced import SessionLocal, DoctorProfile, User, Consultation
+
+logger = logging.getLogger(__name__)
+
+# Safety net for deployments with several worker processes: approve/reject only invalidates the
+# directory in the process that handled it, the others pick the change up after this many seconds.
+DIRECTORY_TTL = int(os.getenv("DOCTOR_DIRECTORY_TTL", "300"))
+
+# Consultations that still occupy a doctor's queue
+ACTIVE_CONSULTATION_STATUSES = frozenset({"scheduled", "accepted"})
+
+_snapshot_versions = itertools.count(1)
+
+
+class DoctorRecord:
+    """Just the fields doctor matching needs, without ORM instance overhead"""
+
+    __slots__ = ("id", "name", "email", "specialization", "years_of_practice", "telemedicine_states", "board_certifications")
+
+    def __init__(self, id, name, email, specialization, years_of_practice, telemedicine_states, board_certifications):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.specialization = specialization
+        self.years_of_practice = years_of_practice
+        self.telemedicine_states = telemedicine_states
+        self.board_certifications = board_certifications
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "specialization": self.specialization,
+            "yearsOfPractice": self.years_of_practice,
+            "telemedicineStates": list(self.telemedicine_states),
+            "currentLoad": doctor_load.get(self.id),
+        }
+
+
+class _Snapshot:
+    """Immutable view of the verified doctors; replaced wholesale on reload so readers never lock"""
+
+    def __init__(self, records: List[DoctorRecord]):
+        self.records = records
+        self.positions: Dict[int, int] = {record.id: position for position, record in enumerate(records)}
+        # Lowercased specialization -> bitset of record positions; state code -> bitset.
+        # Python ints are arbitrary-precision, so a set of doctors is one int and AND/OR are cheap.
+        self.by_specialty: Dict[str, int] = {}
+        self.by_state: Dict[str, int] = {}
+        for position, record in enumerate(records):
+            bit = 1 << position
+            key = (record.specialization or "").lower()
+            self.by_specialty[key] = self.by_specialty.get(key, 0) | bit
+            for state in record.telemedicine_states:
+                self.by_state[state] = self.by_state.get(state, 0) | bit
+        self.all_mask = (1 << len(records)) - 1
+
+        # Column arrays for vectorised scoring, indexed by record position
+        self.specialty_keys: List[str] = list(self.by_specialty)
+        key_ids = {key: i for i, key in enumerate(self.specialty_keys)}
+        self.specialty_ids = np.fromiter(
+            (key_ids[(r.specialization or "").lower()] for r in records), dtype=np.int32, count=len(records)
+        )
+        self.years = np.fromiter((r.years_of_practice for r in records), dtype=np.int32, count=len(records))
+        self.cert_counts = np.fromiter((len(r.board_certifications) for r in records), dtype=np.int32, count=len(records))
+        self.ids = np.fromiter((r.id for r in records), dtype=np.int64, count=len(records))
+        self.loaded_at = time.monotonic()
+        # Distinct per load, so caches of directory-derived results can key on it
+        self.version = next(_snapshot_versions)
+
+
+def _positions(mask: int) -> Iterable[int]:
+    """Set bit positions of mask in ascending order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class DoctorDirectory:
+    """In-process index of verified doctors for specialty / state matching.
+
+    Loaded at startup and after invalidate(); queries never touch the database.
+    """
+
+    def __init__(self, ttl: int = DIRECTORY_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(
+                    User.id, User.name, User.email, DoctorProfile.primary_specialization,
+                    DoctorProfile.years_of_practice, DoctorProfile.telemedicine_states,
+                    DoctorProfile.board_certifications
+                )
+                .join(DoctorProfile, DoctorProfile.user_id == User.id)
+                .filter(User.role == "doctor", DoctorProfile.verification_status == "verified")
+                .order_by(User.id)
+                .all()
+            )
+        finally:
+            db.close()
+        records = [
+            DoctorRecord(
+                user_id, name, email, specialization, years or 0,
+                tuple(s.upper() for s in states or []), tuple(certs or [])
+            )
+            for user_id, name, email, specialization, years, states, certs in rows
+        ]
+        self._snapshot = _Snapshot(records)
+        logger.info(f"Doctor directory loaded with {len(records)} verified doctors")
+
+    def invalidate(self):
+        """Drop the current snapshot; the next query reloads it"""
+        self._snapshot = None
+
+    def snapshot(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+                    self.load()
+                    snapshot = self._snapshot
+        return snapshot
+
+    @staticmethod
+    def specialty_key_mask(snapshot: _Snapshot, specialties: Iterable[str]) -> np.ndarray:
+        """Boolean array over snapshot.specialty_keys: which specializations contain any of the specialties"""
+        needles = [s.lower() for s in specialties if s]
+        return np.fromiter(
+            (any(needle in key for needle in needles) for key in snapshot.specialty_keys),
+            dtype=bool, count=len(snapshot.specialty_keys)
+        )
+
+    @staticmethod
+    def _specialty_mask(snapshot: _Snapshot, specialties: Iterable[str]) -> int:
+        # Same semantics as primary_specialization ILIKE '%spec%', but over the few distinct
+        # specialization strings rather than every doctor
+        needles = [s.lower() for s in specialties if s]
+        mask = 0
+        for key, bits in snapshot.by_specialty.items():
+            if any(needle in key for needle in needles):
+                mask |= bits
+        return mask
+
+    def match(
+        self, specialties: Optional[Iterable[str]] = None, state: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[_Snapshot, List[int]]:
+        """Positions (in user id order) of verified doctors matching any of the specialties and the state.
+
+        Returns the snapshot the positions refer to; no filter means every verified doctor.
+        """
+        snapshot = self.snapshot()
+        mask = snapshot.all_mask
+        specialties = [s for s in (specialties or []) if s]
+        if specialties:
+            mask &= self._specialty_mask(snapshot, specialties)
+        if state:
+            mask &= snapshot.by_state.get(state.upper(), 0)
+        positions = []
+        for position in _positions(mask):
+            if limit is not None and len(positions) >= limit:
+                break
+            positions.append(position)
+        return snapshot, positions
+
+    def get(self, doctor_id: int) -> Optional[DoctorRecord]:
+        """The verified doctor with this user id, if any"""
+        snapshot = self.snapshot()
+        position = snapshot.positions.get(doctor_id)
+        return snapshot.records[position] if position is not None else None
+
+    def find(
+        self, specialization: Optional[str] = None, state: Optional[str] = None,
+        limit: Optional[int] = None, least_loaded: bool = False
+    ) -> List[DoctorRecord]:
+        """Matching doctors in user id order, or with the shortest queues first if least_loaded"""
+        if not least_loaded:
+            snapshot, positions = self.match([specialization] if specialization else None, state, limit)
+            return [snapshot.records[p] for p in positions]
+        snapshot, positions = self.match([specialization] if specialization else None, state)
+        records = sorted((snapshot.records[p] for p in positions), key=lambda r: doctor_load.get(r.id))
+        return records if limit is None else records[:limit]
+
+
+class DoctorLoadTracker:
+    """Open (scheduled / accepted) consultation counts per doctor user id.
+
+    Seeded with one GROUP BY and then kept current by the routes that create consultations or
+    change their status / doctor; re-seeded after DOCTOR_DIRECTORY_TTL to absorb writes made by
+    other processes.
+    """
+
+    def __init__(self, ttl: int = DIRECTORY_TTL):
+        self.ttl = ttl
+        self._counts: Optional[Dict[int, int]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Consultation.doctor_id, func.count(Consultation.id))
+                .filter(Consultation.doctor_id.isnot(None))
+                .filter(Consultation.status.in_(ACTIVE_CONSULTATION_STATUSES))
+                .group_by(Consultation.doctor_id)
+                .all()
+            )
+        finally:
+            db.close()
+        with self._lock:
+            self._counts = {doctor_id: count for doctor_id, count in rows}
+            self._loaded_at = time.monotonic()
+
+    def _counts_now(self) -> Dict[int, int]:
+        if self._counts is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.load()
+        return self._counts
+
+    def get(self, doctor_id: int) -> int:
+        return self._counts_now().get(doctor_id, 0)
+
+    def counts(self) -> Dict[int, int]:
+        """Live doctor id -> open consultation count mapping; treat as read-only"""
+        return self._counts_now()
+
+    def transition(
+        self, old_doctor_id: Optional[int], old_status: Optional[str],
+        new_doctor_id: Optional[int], new_status: Optional[str]
+    ):
+        """Apply a committed consultation change (pass None for the old side of a new consultation)"""
+        if self._counts is None:
+            return
+        with self._lock:
+            counts = self._counts
+            if old_doctor_id is not None and old_status in ACTIVE_CONSULTATION_STATUSES:
+                counts[old_doctor_id] = max(counts.get(old_doctor_id, 0) - 1, 0)
+            if new_doctor_id is not None and new_status in ACTIVE_CONSULTATION_STATUSES:
+                counts[new_doctor_id] = counts.get(new_doctor_id, 0) + 1
+
+
+doctor_directory = DoctorDirectory()
+doctor_load = DoctorLoadTracker()
@@ -0,0 +1,279 @@
+import hashlib
+import io
+import os
+import shutil
+import struct
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Envelope layout (all integers big-endian):
+#   magic "RHEF" | version u8 | chunk_size u32 | wrapped_key_len u16 | wrapped_key | nonce_prefix (7 bytes)
+# followed by chunks of AES-256-GCM ciphertext, each chunk_size + 16 bytes except the last.
+# Chunk nonces are nonce_prefix | chunk index u32 | last-chunk flag u8 (the STREAM construction),
+# and the header is bound to every chunk as associated data, so chunks cannot be reordered,
+# truncated or moved between files.
+MAGIC = b"RHEF"
+VERSION = 1
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+_FIXED_HEADER = struct.Struct(">4sBIH")
+
+
+def _key_cipher() -> Fernet:
+    key = os.getenv("ENCRYPTION_KEY")
+    if not key:
+        raise RuntimeError("ENCRYPTION_KEY not set")
+    return Fernet(key.encode() if isinstance(key, str) else key)
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+class EncryptedFileWriter:
+    """Encrypts a stream chunk by chunk under a fresh per-file data key."""
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        data_key = AESGCM.generate_key(bit_length=256)
+        wrapped_key = _key_cipher().encrypt(data_key)
+        self._aead = AESGCM(data_key)
+        self._nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self._header = (
+            _FIXED_HEADER.pack(MAGIC, VERSION, chunk_size, len(wrapped_key))
+            + wrapped_key
+            + self._nonce_prefix
+        )
+        self._buffer = bytearray()
+        self._index = 0
+        self._fh = open(path, "wb")
+        self._fh.write(self._header)
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        self._digest.update(data)
+        self.size += len(data)
+        # Always hold back the tail so close() has a non-empty final chunk unless the file is empty
+        while len(self._buffer) > self.chunk_size:
+            self._write_chunk(bytes(self._buffer[:self.chunk_size]), last=False)
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the plaintext written so far."""
+        return self._digest.hexdigest()
+
+    def _write_chunk(self, plaintext: bytes, last: bool):
+        nonce = _nonce(self._nonce_prefix, self._index, last)
+        self._fh.write(self._aead.encrypt(nonce, plaintext, self._header))
+        self._index += 1
+
+    def close(self):
+        if self._fh.closed:
+            return
+        self._write_chunk(bytes(self._buffer), last=True)
+        self._buffer.clear()
+        self._fh.close()
+
+    def abort(self):
+        """Discard a partially written file."""
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class EncryptedFileReader(io.RawIOBase):
+    """Seekable read-only view of an encrypted file; decrypts one chunk at a time."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.name = path
+        self._fh = open(path, "rb")
+        try:
+            fixed = self._fh.read(_FIXED_HEADER.size)
+            magic, version, chunk_size, wrapped_len = _FIXED_HEADER.unpack(fixed)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not an encrypted medical file")
+            wrapped_key = self._fh.read(wrapped_len)
+            nonce_prefix = self._fh.read(NONCE_PREFIX_SIZE)
+        except Exception:
+            self._fh.close()
+            raise
+        self._header = fixed + wrapped_key + nonce_prefix
+        self._aead = AESGCM(_key_cipher().decrypt(wrapped_key))
+        self._nonce_prefix = nonce_prefix
+        self.chunk_size = chunk_size
+        self._stored_chunk = chunk_size + TAG_SIZE
+
+        body = os.fstat(self._fh.fileno()).st_size - len(self._header)
+        self._chunk_count = max(1, -(-body // self._stored_chunk))
+        self.size = body - self._chunk_count * TAG_SIZE
+        if self.size < 0:
+            self._fh.close()
+            raise ValueError("Encrypted file is truncated")
+
+        self._pos = 0
+        self._cached_index = -1
+        self._cached_chunk = b""
+
+    def _chunk(self, index: int) -> bytes:
+        if index != self._cached_index:
+            self._fh.seek(len(self._header) + index * self._stored_chunk)
+            ciphertext = self._fh.read(self._stored_chunk)
+            last = index == self._chunk_count - 1
+            self._cached_chunk = self._aead.decrypt(
+                _nonce(self._nonce_prefix, index, last), ciphertext, self._header
+            )
+            self._cached_index = index
+        return self._cached_chunk
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self.size:
+            return 0
+        index, offset = divmod(self._pos, self.chunk_size)
+        chunk = self._chunk(index)
+        n = min(len(buffer), len(chunk) - offset, self.size - self._pos)
+        buffer[:n] = chunk[offset:offset + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._fh.close()
+            self._cached_chunk = b""
+        super().close()
+
+
+def is_encrypted(path: str) -> bool:
+    with open(path, "rb") as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def encrypt_stream(source: BinaryIO, dest_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, str]:
+    """Encrypt a readable stream to dest_path; returns (plaintext size, plaintext SHA-256)."""
+    with EncryptedFileWriter(dest_path, chunk_size) as writer:
+        shutil.copyfileobj(source, writer, chunk_size)
+    return writer.size, writer.content_hash
+
+
+def write_encrypted_bytes(dest_path: str, data: bytes):
+    """Atomically write a small blob (e.g. a derivative) in the envelope format."""
+    # A unique temp name per writer: a background render and an on-demand one may write the same derivative
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        with EncryptedFileWriter(tmp_path) as writer:
+            writer.write(data)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def open_stored_file(path: str) -> BinaryIO:
+    """Open an uploaded file for reading, transparently decrypting envelope files.
+
+    Files written before encryption at rest was introduced are returned as-is.
+    """
+    if is_encrypted(path):
+        return io.BufferedReader(EncryptedFileReader(path), buffer_size=DEFAULT_CHUNK_SIZE)
+    return open(path, "rb")
+
+
+def stored_file_size(path: str) -> int:
+    """Plaintext size of an uploaded file."""
+    if is_encrypted(path):
+        with EncryptedFileReader(path) as reader:
+            return reader.size
+    return os.path.getsize(path)
+
+
+def stored_file_hash(path: str) -> str:
+    """SHA-256 of the plaintext of an uploaded file, computed in a single streaming pass."""
+    digest = hashlib.sha256()
+    with open_stored_file(path) as fh:
+        for block in iter(lambda: fh.read(DEFAULT_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_stored_file(path: str, start: int = 0, end: Optional[int] = None,
+                     block_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield plaintext bytes [start, end] (inclusive) of an uploaded file."""
+    with open_stored_file(path) as fh:
+        fh.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            data = fh.read(block_size if remaining is None else min(block_size, remaining))
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+
+@contextmanager
+def decrypted_copy(path: str) -> Iterator[str]:
+    """Yield a plaintext path for tools that can only read from disk (e.g. pdftoppm).
+
+    The temporary copy is streamed chunk by chunk and removed on exit.
+    """
+    if not is_encrypted(path):
+        yield path
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as out, open_stored_file(path) as src:
+            shutil.copyfileobj(src, out, DEFAULT_CHUNK_SIZE)
+        yield tmp_path
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,89 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..database_enhanced import SessionLocal, MedicalFile, Patient
+from .ocr_service import OCRService
+from .dicom_service import DicomService
+from .derivatives import DerivativeService
+from .ai_recommendation import AIRecommendationService
+
+logger = logging.getLogger(__name__)
+
+OCR_TYPES = {".jpg", ".jpeg", ".png", ".pdf"}
+
+# Shared pool for post-upload work (OCR, DICOM header parsing, previews).
+# Tesseract and pdftoppm run as subprocesses and Pillow releases the GIL while decoding,
+# so threads give real parallelism here.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FILE_PROCESSING_WORKERS", "4")),
+    thread_name_prefix="file-processing"
+)
+
+
+class FileProcessingService:
+    """Post-upload processing that runs outside the request/response cycle"""
+
+    @staticmethod
+    def record_ocr_result(db: Session, medical_file: MedicalFile, ocr_text: Optional[str]):
+        """Store OCR output with its clinical keywords and roll the specialties up onto the patient.
+
+        The caller commits; the patient's cached recommendations are dropped once that commit
+        lands, so a request in between cannot re-cache the pre-OCR specialties.
+        """
+        medical_file.ocr_text = ocr_text
+        conditions, specialties = AIRecommendationService.extract_clinical_features(ocr_text)
+        medical_file.clinical_keywords = conditions
+        medical_file.clinical_specialties = specialties
+        if specialties:
+            patient = db.query(Patient).filter(Patient.id == medical_file.patient_id).with_for_update().first()
+            if patient:
+                patient.clinical_specialties = sorted(set(patient.clinical_specialties or []) | set(specialties))
+            patient_id = medical_file.patient_id
+            event.listen(
+                db, "after_commit",
+                lambda session: AIRecommendationService.invalidate_patient(patient_id),
+                once=True
+            )
+
+    @staticmethod
+    def process_file(file_id: int, file_path: str) -> str:
+        """Run OCR / DICOM indexing and render previews for one stored file; returns a status"""
+        db = SessionLocal()
+        try:
+            medical_file = db.query(MedicalFile).filter(MedicalFile.id == file_id).first()
+            if not medical_file:
+                return "missing"
+
+            if medical_file.file_type in OCR_TYPES and medical_file.ocr_text is None:
+                ocr_text = OCRService.extract_text_from_file(file_path)
+                FileProcessingService.record_ocr_result(db, medical_file, ocr_text)
+            elif medical_file.file_type == ".dcm" and medical_file.dicom_frame_count is None:
+                meta = DicomService.read_metadata(file_path)
+                if meta:
+                    DicomService.apply_metadata(medical_file, meta)
+            db.commit()
+
+            DerivativeService.generate_previews(file_path, medical_file.file_type, medical_file.content_hash)
+            return "processed"
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Post-processing failed for file {file_id}: {str(e)}")
+            return "failed"
+        finally:
+            db.close()
+
+    @staticmethod
+    def process_files(jobs: List[Tuple[int, str]]) -> Dict[int, str]:
+        """Fan (file_id, file_path) jobs out across the processing pool and wait for all of them"""
+        futures = {
+            file_id: _executor.submit(FileProcessingService.process_file, file_id, file_path)
+            for file_id, file_path in jobs
+        }
+        results = {file_id: future.result() for file_id, future in futures.items()}
+        logger.info(f"Processed {len(results)} uploaded files: {results}")
+        return results
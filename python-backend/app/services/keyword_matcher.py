@@ -0,0 +1,114 @@
+import threading
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton matching many terms in a single pass over the text.
+
+    Matching is case-insensitive and word-boundary aware: "ear" matches "ear pain" but not
+    "heart". A trailing plural "s" / "es" is accepted, so "rash" also matches "rashes".
+    Cost is O(len(text) + matches), independent of the number of terms.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = sorted({t.lower().strip() for t in terms if t and t.strip()})
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for term_id, term in enumerate(self.terms):
+            state = 0
+            for ch in term:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state] += (term_id,)
+
+        # Breadth-first failure links; outputs are merged along them so the search loop never follows chains
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+        self._lengths = [len(t) for t in self.terms]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @staticmethod
+    def _word_end(text: str, end: int) -> Optional[int]:
+        """End index of the word if a term ending at `end` sits on a word boundary (allowing a plural suffix)"""
+        n = len(text)
+        for suffix in ("", "s", "es"):
+            stop = end + len(suffix)
+            if text.startswith(suffix, end) and (stop == n or not text[stop].isalnum()):
+                return stop
+        return None
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """All (start, end, term) matches in text order; overlapping terms are all reported"""
+        text = (text or "").lower()
+        goto, fail, out, lengths, terms = self._goto, self._fail, self._out, self._lengths, self.terms
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for term_id in out[state]:
+                    start = end - lengths[term_id]
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if self._word_end(text, end) is None:
+                        continue
+                    matches.append((start, end, terms[term_id]))
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        return matches
+
+    def find_terms(self, text: str) -> List[str]:
+        """Distinct matched terms in order of first occurrence"""
+        return list(dict.fromkeys(term for _, _, term in self.find(text)))
+
+
+# One automaton over every clinical vocabulary in the process. Services register their terms
+# and map matched terms back through their own tables.
+_vocabularies: Dict[str, FrozenSet[str]] = {}
+_matcher: Optional[KeywordMatcher] = None
+_lock = threading.Lock()
+
+
+def register_vocabulary(name: str, terms: Iterable[str]):
+    """Add or replace a named vocabulary; the shared automaton is rebuilt on next use if it changed"""
+    global _matcher
+    normalized = frozenset(t.lower().strip() for t in terms if t and t.strip())
+    with _lock:
+        if _vocabularies.get(name) != normalized:
+            _vocabularies[name] = normalized
+            _matcher = None
+
+
+def clinical_matcher() -> KeywordMatcher:
+    """The shared automaton over all registered vocabularies, compiled once and reused"""
+    global _matcher
+    matcher = _matcher
+    if matcher is None:
+        with _lock:
+            if _matcher is None:
+                _matcher = KeywordMatcher(set().union(*_vocabularies.values()))
+            matcher = _matcher
+    return matcher
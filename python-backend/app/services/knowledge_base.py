@@ -1,54 +1,344 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from .autocomplete import Autocompleter
+from .keyword_matcher import KeywordMatcher, clinical_matcher, register_vocabulary
+from .knowledge_index import normalize_key, open_jsonl_index
+
+logger = logging.getLogger(__name__)
+
+# A versioned knowledge release: manifest.json naming the formulary (JSON lines), guidelines
+# and symptom rules files. Point this at a new version directory to roll a release forward.
+DATA_DIR = os.getenv(
+    "KNOWLEDGE_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "knowledge", "v1")
+)
+
+# Formulary fields that resolve to a drug in lookups
+DRUG_KEY_FIELDS = ("id", "name", "synonyms", "brands")
+
+# Ranked symptom analysis returns at most this many rules by default
+MAX_SYMPTOM_MATCHES = 5
+
+
+# Prescription text is split into tokens on whitespace and list punctuation; drug names are
+# recognised as the longest run of tokens that is a formulary key
+_PRESCRIPTION_TOKEN_RE = re.compile(r"[^\s,;:+()\[\]]+")
+
+
+class InteractionGraph(NamedTuple):
+    """Formulary safety data keyed by record id, precomputed once per formulary"""
+    names: Dict[int, str]
+    interacts: Dict[int, FrozenSet[int]]  # symmetric: a lists b or b lists a
+    contraindications: Dict[int, FrozenSet[str]]  # normalised condition terms
+    condition_matcher: KeywordMatcher  # every contraindication term, for free-text patient history
+    max_key_words: int
+
+
+class SymptomRule(NamedTuple):
+    id: str
+    symptoms: frozenset
+    conditions: List[str]
+
+
 class KnowledgeBase:
-    def __init__(self):
-        self.drug_database = {
-            'paracetamol': {
-                "name": "Paracetamol",
-                "dosage": "500mg-1g every 4-6 hours",
-                "maxDaily": "4g",
-                "contraindications": ["Liver disease"],
-                "interactions": ["Warfarin"]
-            },
-            'amoxicillin': {
-                "name": "Amoxicillin",
-                "dosage": "250-500mg every 8 hours",
-                "duration": "7-10 days",
-                "contraindications": ["Penicillin allergy"],
-                "sideEffects": ["Nausea", "Diarrhea"]
-            }
-        }
-        
-        self.guidelines = {
-            'hypertension': {
-                "condition": "Hypertension",
-                "criteria": "BP ≥140/90 mmHg",
-                "treatment": "Lifestyle + ACE inhibitors",
-                "monitoring": "Monthly BP checks"
-            },
-            'diabetes': {
-                "condition": "Type 2 Diabetes",
-                "criteria": "HbA1c ≥6.5%",
-                "treatment": "Metformin + lifestyle",
-                "monitoring": "HbA1c every 3 months"
-            }
-        }
-        
-        self.symptom_map = {
-            frozenset(['fever', 'cough', 'fatigue']): ['Common cold', 'Flu', 'COVID-19'],
-            frozenset(['chest pain', 'shortness of breath']): ['Angina', 'Heart attack', 'Pneumonia'],
-            frozenset(['headache', 'nausea', 'vomiting']): ['Migraine', 'Hypertension', 'Meningitis']
-        }
-    
+    """Formulary, guidelines and symptom rules from the versioned data files in data_dir.
+
+    Nothing is read until first use. The formulary is never materialised as dicts: lookups
+    binary-search a compiled, memory-mapped key index and parse only the matching JSON line.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._manifest: Optional[dict] = None
+        self._version: Optional[str] = None
+        self._formulary = None
+        self._guidelines: Optional[Dict[str, dict]] = None
+        self._guideline_names: List[Tuple[str, str]] = []
+        self._suggestions: Optional[Autocompleter] = None
+        self._interactions: Optional[InteractionGraph] = None
+        self._symptom_rules: Optional[Tuple[SymptomRule, ...]] = None
+        self._symptom_postings: Dict[str, Tuple[int, ...]] = {}
+        self.symptom_terms = frozenset()
+
+    def data_file(self, name: str) -> str:
+        """Path of one of the release's files (as named in the manifest)"""
+        return os.path.join(self.data_dir, self.manifest["files"][name])
+
+    @property
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            with open(os.path.join(self.data_dir, "manifest.json"), "r", encoding="utf-8") as fh:
+                self._manifest = json.load(fh)
+        return self._manifest
+
+    @property
+    def version(self) -> str:
+        """The manifest's release version qualified with a hash of the data files it names.
+
+        Responses and packs are cached on this, so data edited without a version bump still
+        gets a new version.
+        """
+        if self._version is None:
+            digest = hashlib.sha256()
+            for name in sorted(self.manifest["files"]):
+                digest.update(f"{name}\0".encode("utf-8"))
+                with open(self.data_file(name), "rb") as fh:
+                    for block in iter(lambda: fh.read(1 << 20), b""):
+                        digest.update(block)
+            self._version = f"{self.manifest['version']}+{digest.hexdigest()[:12]}"
+        return self._version
+
+    @property
+    def formulary(self):
+        """(SortedKeyIndex, JsonlStore) over the formulary, compiled/mapped on first use"""
+        if self._formulary is None:
+            with self._lock:
+                if self._formulary is None:
+                    self._formulary = open_jsonl_index(self.data_file("formulary"), DRUG_KEY_FIELDS)
+                    logger.info(f"Knowledge base {self.version}: formulary index mapped ({len(self._formulary[0])} keys)")
+        return self._formulary
+
+    @property
+    def guidelines(self) -> Dict[str, dict]:
+        if self._guidelines is None:
+            with open(self.data_file("guidelines"), "r", encoding="utf-8") as fh:
+                raw = json.load(fh)
+            guidelines = {}
+            names = []
+            for key, guideline in raw.items():
+                public = {k: v for k, v in guideline.items() if k != "aliases"}
+                condition = guideline.get("condition", "")
+                for name in [key, condition] + guideline.get("aliases", []):
+                    if normalize_key(name):
+                        guidelines.setdefault(normalize_key(name), public)
+                        if name != key:
+                            names.append((name, condition or key))
+            self._guideline_names = names
+            self._guidelines = guidelines
+        return self._guidelines
+
+    @property
+    def interaction_graph(self) -> InteractionGraph:
+        if self._interactions is None:
+            index, store = self.formulary
+            with self._lock:
+                if self._interactions is None:
+                    self._interactions = self._build_interaction_graph(index, store)
+        return self._interactions
+
+    @staticmethod
+    def _build_interaction_graph(index, store) -> InteractionGraph:
+        names: Dict[int, str] = {}
+        interacts: Dict[int, set] = defaultdict(set)
+        contraindications: Dict[int, FrozenSet[str]] = {}
+        unresolved = 0
+        for record_id, record in store:
+            names[record_id] = record["name"]
+            for other in record.get("interactions") or []:
+                other_id = index.find(normalize_key(other))
+                if other_id is None or other_id == record_id:
+                    unresolved += other_id is None
+                    continue
+                interacts[record_id].add(other_id)
+                interacts[other_id].add(record_id)
+            terms = frozenset(normalize_key(c) for c in record.get("contraindications") or [] if normalize_key(c))
+            if terms:
+                contraindications[record_id] = terms
+        if unresolved:
+            logger.warning(f"{unresolved} formulary interactions name drugs that are not in the formulary")
+        return InteractionGraph(
+            names=names,
+            interacts={record_id: frozenset(others) for record_id, others in interacts.items()},
+            contraindications=contraindications,
+            condition_matcher=KeywordMatcher(frozenset().union(*contraindications.values())),
+            max_key_words=max((len(key.split()) for key, _ in index.items()), default=1),
+        )
+
+    @property
+    def symptom_rules(self) -> Tuple[SymptomRule, ...]:
+        """Symptom clusters in file order, with an inverted index symptom -> rule positions"""
+        if self._symptom_rules is None:
+            with open(self.data_file("symptomRules"), "r", encoding="utf-8") as fh:
+                raw = json.load(fh)["rules"]
+            rules = tuple(
+                SymptomRule(rule["id"], frozenset(normalize_key(s) for s in rule["symptoms"]), rule["conditions"])
+                for rule in raw
+            )
+            postings = defaultdict(list)
+            for position, rule in enumerate(rules):
+                for symptom in rule.symptoms:
+                    postings[symptom].append(position)
+            self._symptom_postings = {symptom: tuple(p) for symptom, p in postings.items()}
+            self.symptom_terms = frozenset(self._symptom_postings)
+            register_vocabulary("knowledge_base.symptoms", self.symptom_terms)
+            self._symptom_rules = rules
+        return self._symptom_rules
+
+    @property
+    def suggestions(self) -> Autocompleter:
+        """Autocomplete over drug names/synonyms/brands, guideline conditions, symptom-rule conditions and symptoms"""
+        if self._suggestions is None:
+            _, store = self.formulary
+            self.guidelines  # also collects the guideline names
+            rules = self.symptom_rules
+            entries = []
+            for _, record in store:
+                for field in ("name", "synonyms", "brands"):
+                    values = record.get(field) or []
+                    for label in [values] if isinstance(values, str) else values:
+                        entries.append((label, "drug", record["name"]))
+            entries.extend((label, "condition", condition) for label, condition in self._guideline_names)
+            for rule in rules:
+                entries.extend((condition, "condition", None) for condition in rule.conditions)
+                entries.extend((symptom, "symptom", None) for symptom in rule.symptoms)
+            with self._lock:
+                if self._suggestions is None:
+                    self._suggestions = Autocompleter(entries)
+        return self._suggestions
+
     def get_drug_info(self, drug_name: str):
-        return self.drug_database.get(drug_name.lower())
-    
+        """Drug record by name, synonym or brand (case and accent insensitive)"""
+        index, store = self.formulary
+        record_id = index.find(normalize_key(drug_name))
+        return store.get(record_id) if record_id is not None else None
+
+    def resolve_drugs(self, entries: Iterable[str]) -> Tuple[List[int], List[str]]:
+        """Formulary record ids mentioned in free-text prescription entries, plus the entries naming none"""
+        index, _ = self.formulary
+        max_words = self.interaction_graph.max_key_words
+        record_ids: Dict[int, None] = {}
+        unrecognized = []
+        for entry in entries:
+            tokens = [t.rstrip(".") for t in _PRESCRIPTION_TOKEN_RE.findall(normalize_key(entry))]
+            found = False
+            i = 0
+            while i < len(tokens):
+                for n in range(min(max_words, len(tokens) - i), 0, -1):
+                    record_id = index.find(" ".join(tokens[i:i + n]))
+                    if record_id is not None:
+                        record_ids[record_id] = None
+                        found = True
+                        i += n
+                        break
+                else:
+                    i += 1
+            if not found and entry.strip():
+                unrecognized.append(entry)
+        return list(record_ids), unrecognized
+
+    def check_prescription(
+        self, drugs: List[str], allergies: Optional[List[str]] = None, medical_history: Optional[List[str]] = None
+    ) -> dict:
+        """Interactions between every pair of prescribed drugs and their conflicts with the patient's record.
+
+        Each pair is a set lookup in the precomputed graph and each drug's contraindications are
+        intersected with the patient's conditions, so the cost is independent of the formulary size.
+        """
+        graph = self.interaction_graph
+        record_ids, unrecognized = self.resolve_drugs(drugs)
+        names = graph.names
+
+        interactions = [
+            {"drugs": [names[a], names[b]]}
+            for a, b in combinations(record_ids, 2)
+            if b in graph.interacts.get(a, ())
+        ]
+
+        # Patient conditions as contraindication terms: exact entries, terms mentioned in free text
+        # ("stage 3 kidney disease") and "<x> allergy" for each allergy
+        conditions: Dict[str, str] = {}
+        for source, entries in (("medicalHistory", medical_history or []), ("allergies", allergies or [])):
+            for entry in entries:
+                key = normalize_key(entry)
+                terms = {key, *graph.condition_matcher.find_terms(key)}
+                if source == "allergies":
+                    terms.add(f"{key} allergy")
+                for term in terms:
+                    conditions.setdefault(term, source)
+
+        contraindications = []
+        for record_id in record_ids:
+            for term in sorted(graph.contraindications.get(record_id, frozenset()) & conditions.keys()):
+                contraindications.append({"drug": names[record_id], "condition": term, "source": conditions[term]})
+
+        # An allergy naming a prescribed drug directly (by name, synonym or brand)
+        allergy_ids = set(self.resolve_drugs(allergies or [])[0])
+        allergy_conflicts = [{"drug": names[record_id]} for record_id in record_ids if record_id in allergy_ids]
+
+        return {
+            "drugs": [names[record_id] for record_id in record_ids],
+            "unrecognized": unrecognized,
+            "interactions": interactions,
+            "contraindications": contraindications,
+            "allergies": allergy_conflicts,
+            "hasWarnings": bool(interactions or contraindications or allergy_conflicts),
+        }
+
     def get_guidelines(self, condition: str):
-        return self.guidelines.get(condition.lower())
-    
-    def analyze_symptoms(self, symptoms: list):
-        symptom_set = frozenset([s.lower() for s in symptoms])
-        
-        for key, conditions in self.symptom_map.items():
-            if symptom_set == key:
-                return conditions
-        
-        return ['Consult specialist']
\ No newline at end of file
+        return self.guidelines.get(normalize_key(condition))
+
+    def _symptom_set(self, symptoms: list) -> frozenset:
+        # Reduce free-text entries ("mild fever since Monday") to the known symptom terms they mention;
+        # entries that mention none are kept verbatim (they count against the match score)
+        matcher = clinical_matcher()
+        symptom_set = set()
+        for s in symptoms:
+            terms = [t for t in matcher.find_terms(s) if t in self.symptom_terms]
+            symptom_set.update(terms or [normalize_key(s)])
+        return frozenset(symptom_set)
+
+    def rank_symptom_rules(self, symptoms: list, limit: int = MAX_SYMPTOM_MATCHES) -> List[dict]:
+        """Symptom clusters sharing at least one symptom with the input, best first.
+
+        Only the rules on the input symptoms' postings lists are touched, so the cost depends on
+        how many rules mention those symptoms, not on the size of the rule table. Ranked by
+        Jaccard similarity, then by number of shared symptoms, then by rule order.
+        """
+        rules = self.symptom_rules
+        symptom_set = self._symptom_set(symptoms)
+        overlaps: Dict[int, int] = defaultdict(int)
+        for symptom in symptom_set:
+            for position in self._symptom_postings.get(symptom, ()):
+                overlaps[position] += 1
+
+        scored = []
+        for position, overlap in overlaps.items():
+            jaccard = overlap / (len(symptom_set) + len(rules[position].symptoms) - overlap)
+            scored.append((-jaccard, -overlap, position))
+        scored.sort()
+
+        matches = []
+        for neg_jaccard, _, position in scored[:limit]:
+            rule = rules[position]
+            matches.append({
+                "ruleId": rule.id,
+                "conditions": rule.conditions,
+                "matchedSymptoms": sorted(symptom_set & rule.symptoms),
+                "missingSymptoms": sorted(rule.symptoms - symptom_set),
+                "score": round(-neg_jaccard, 3),
+            })
+        return matches
+
+    @staticmethod
+    def conditions_from_matches(matches: List[dict]) -> List[str]:
+        """Distinct conditions of ranked matches, most likely first"""
+        conditions = []
+        for match in matches:
+            conditions.extend(c for c in match["conditions"] if c not in conditions)
+        return conditions or ['Consult specialist']
+
+    def analyze_symptoms(self, symptoms: list, limit: int = MAX_SYMPTOM_MATCHES) -> List[str]:
+        return self.conditions_from_matches(self.rank_symptom_rules(symptoms, limit))
+
+
+# Shared instance: routes and hooks use one set of mapped files and precomputed indexes
+knowledge_base = KnowledgeBase()
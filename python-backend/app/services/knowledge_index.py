@@ -0,0 +1,167 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import unicodedata
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Compiled sorted-key indexes live outside the (possibly read-only) data directory. They are
+# named after the source digest, so every worker process maps the same file and the OS page
+# cache holds a single copy.
+INDEX_CACHE_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "rural-health-knowledge"))
+
+_MAGIC = b"RHKI"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHII")  # magic, format version, key count, record count
+
+
+def normalize_key(text: str) -> str:
+    """Case-, diacritic- and whitespace-insensitive form used for every knowledge lookup"""
+    text = unicodedata.normalize("NFKD", (text or "").casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JsonlStore:
+    """Records of a JSON-lines file, read on demand from a memory map by line offset"""
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self.path = path
+        self.offsets = offsets
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(fh.fileno()).st_size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, record_id: int) -> dict:
+        start, end = int(self.offsets[record_id]), int(self.offsets[record_id + 1])
+        return json.loads(self._map[start:end])
+
+    def __iter__(self) -> Iterator[Tuple[int, dict]]:
+        """(record id, record) for every non-blank line"""
+        for record_id in range(len(self)):
+            if self.offsets[record_id + 1] - self.offsets[record_id] > 1:
+                yield record_id, self.get(record_id)
+
+
+class SortedKeyIndex:
+    """Read-only map from normalised key to record id over a memory-mapped compiled file.
+
+    Layout: header | record line offsets u64[records + 1] | key offsets u32[keys + 1] |
+    key record ids u32[keys] | UTF-8 key bytes, sorted. Lookups binary-search the key array in
+    place; nothing is copied into Python objects until a key is actually compared.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_keys, n_records = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"{path} is not a knowledge index (format {_FORMAT_VERSION})")
+        offset = _HEADER.size
+        self.record_offsets = np.frombuffer(self._map, dtype="<u8", count=n_records + 1, offset=offset)
+        offset += 8 * (n_records + 1)
+        self._key_offsets = np.frombuffer(self._map, dtype="<u4", count=n_keys + 1, offset=offset)
+        offset += 4 * (n_keys + 1)
+        self._key_records = np.frombuffer(self._map, dtype="<u4", count=n_keys, offset=offset)
+        offset += 4 * n_keys
+        self._keys_start = offset
+        self._n_keys = n_keys
+
+    def __len__(self) -> int:
+        return self._n_keys
+
+    def key(self, i: int) -> str:
+        start = self._keys_start + int(self._key_offsets[i])
+        end = self._keys_start + int(self._key_offsets[i + 1])
+        return self._map[start:end].decode("utf-8")
+
+    def record_id(self, i: int) -> int:
+        return int(self._key_records[i])
+
+    def bisect_left(self, key: str) -> int:
+        lo, hi = 0, self._n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, key: str) -> Optional[int]:
+        """Record id for an already-normalised key"""
+        i = self.bisect_left(key)
+        if i < self._n_keys and self.key(i) == key:
+            return self.record_id(i)
+        return None
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        for i in range(self._n_keys):
+            yield self.key(i), self.record_id(i)
+
+
+def compile_jsonl_index(source: str, key_fields: Iterable[str], path: str):
+    """Compile a JSON-lines file into a SortedKeyIndex file keyed by the given (str or list) fields"""
+    key_fields = list(key_fields)
+    record_offsets = [0]
+    pairs: List[Tuple[str, int]] = []
+    with open(source, "rb") as fh:
+        for line in fh:
+            record_id = len(record_offsets) - 1
+            record_offsets.append(record_offsets[-1] + len(line))
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for field in key_fields:
+                values = record.get(field) or []
+                for value in [values] if isinstance(values, str) else values:
+                    key = normalize_key(value)
+                    if key:
+                        pairs.append((key, record_id))
+    # Sorted by key; for a key shared by several records the earliest record wins lookups
+    pairs = sorted(set(pairs))
+    key_bytes = [key.encode("utf-8") for key, _ in pairs]
+    key_offsets = np.zeros(len(pairs) + 1, dtype="<u4")
+    key_offsets[1:] = np.cumsum([len(k) for k in key_bytes], dtype=np.int64)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(pairs), len(record_offsets) - 1))
+            out.write(np.asarray(record_offsets, dtype="<u8").tobytes())
+            out.write(key_offsets.tobytes())
+            out.write(np.asarray([r for _, r in pairs], dtype="<u4").tobytes())
+            out.write(b"".join(key_bytes))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def open_jsonl_index(source: str, key_fields: Iterable[str]) -> Tuple[SortedKeyIndex, JsonlStore]:
+    """Map the compiled index for source, compiling it first if this content has not been seen"""
+    key_fields = list(key_fields)
+    digest = file_digest(source)
+    fields_tag = hashlib.sha256(",".join(key_fields).encode()).hexdigest()[:8]
+    name = f"{os.path.basename(source)}.{digest[:16]}.{fields_tag}.v{_FORMAT_VERSION}.idx"
+    path = os.path.join(INDEX_CACHE_DIR, name)
+    if not os.path.exists(path):
+        compile_jsonl_index(source, key_fields, path)
+    index = SortedKeyIndex(path)
+    return index, JsonlStore(source, index.record_offsets)
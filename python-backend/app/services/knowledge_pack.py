@@ -0,0 +1,184 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+from typing import Optional, Tuple
+
+import zstandard as zstd
+
+from .knowledge_base import KnowledgeBase, knowledge_base
+from .triage_engine import TriageEngine, triage_engine
+
+logger = logging.getLogger(__name__)
+
+# Published packs (and the deltas between them) are kept here so offline clients on any of the
+# last PACK_HISTORY versions can update with a delta instead of a full download
+PACKS_DIR = os.getenv("KNOWLEDGE_PACKS_DIR", "knowledge_packs")
+PACK_HISTORY = int(os.getenv("KNOWLEDGE_PACK_HISTORY", "10"))
+PACK_FORMAT = 1
+DELTA_LEVEL = 19
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class KnowledgePackStore:
+    """Versioned offline bundle of the formulary, guidelines, symptom rules and triage decision tree.
+
+    A pack is canonical JSON (sorted keys, no whitespace) so identical content always has the same
+    bytes and id (the first 16 hex digits of its SHA-256). Full downloads are gzip. Updates are
+    zstd "patch-from" deltas: the new pack compressed with the client's current pack as a raw
+    content dictionary, so only what changed between the two versions is transferred.
+    """
+
+    def __init__(self, kb: KnowledgeBase, engine: TriageEngine, packs_dir: str = PACKS_DIR):
+        self.kb = kb
+        self.engine = engine
+        self.packs_dir = packs_dir
+        self._lock = threading.Lock()
+        self._sources: Optional[Tuple[str, str]] = None  # (knowledge version, triage version) of the current pack
+        self._manifest: Optional[dict] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.packs_dir, name)
+
+    def build(self) -> Tuple[dict, bytes]:
+        """(pack metadata, canonical JSON bytes) for the knowledge and triage rules currently loaded"""
+        _, store = self.kb.formulary
+        with open(self.kb.data_file("guidelines"), "r", encoding="utf-8") as fh:
+            guidelines = json.load(fh)
+        tree = self.engine.decision_tree()
+        content = {
+            "format": PACK_FORMAT,
+            "knowledgeVersion": self.kb.version,
+            "triageVersion": tree["version"],
+            "formulary": [record for _, record in store],
+            "guidelines": guidelines,
+            "symptomRules": [
+                {"id": rule.id, "symptoms": sorted(rule.symptoms), "conditions": rule.conditions}
+                for rule in self.kb.symptom_rules
+            ],
+            "triageTree": tree,
+        }
+        raw = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        meta = {
+            "id": hashlib.sha256(raw).hexdigest()[:16],
+            "knowledgeVersion": content["knowledgeVersion"],
+            "triageVersion": content["triageVersion"],
+            "size": len(raw),
+        }
+        return meta, raw
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self._path("manifest.json"), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {"format": PACK_FORMAT, "latest": None, "packs": []}
+
+    def manifest(self) -> dict:
+        """Published packs, newest last, publishing the current knowledge first if it changed"""
+        sources = (self.kb.version, self.engine.plan().version)
+        if self._manifest is not None and sources == self._sources:
+            return self._manifest
+        with self._lock:
+            if self._manifest is None or sources != self._sources:
+                self._manifest = self._publish()
+                self._sources = sources
+        return self._manifest
+
+    def _publish(self) -> dict:
+        os.makedirs(self.packs_dir, exist_ok=True)
+        # Every worker publishes at startup; the manifest read-modify-write and pack retirement
+        # must not interleave between processes
+        with open(self._path(".publish.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return self._publish_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _publish_locked(self) -> dict:
+        manifest = self._load_manifest()
+        meta, raw = self.build()
+        if manifest["latest"] == meta["id"]:
+            return manifest
+
+        compressed = gzip.compress(raw, compresslevel=9, mtime=0)
+        _write_atomic(self._path(f"{meta['id']}.json"), raw)
+        _write_atomic(self._path(f"{meta['id']}.json.gz"), compressed)
+        meta.update({
+            "gzipSize": len(compressed),
+            "sha256": hashlib.sha256(compressed).hexdigest(),
+            "published": datetime.utcnow().isoformat() + "Z",
+        })
+        packs = [p for p in manifest["packs"] if p["id"] != meta["id"]] + [meta]
+        for retired in packs[:-PACK_HISTORY]:
+            for name in os.listdir(self.packs_dir):
+                if name.startswith(retired["id"]) or f"-{retired['id']}." in name:
+                    try:
+                        os.unlink(self._path(name))
+                    except FileNotFoundError:
+                        pass  # already removed, e.g. by a process without the lock
+        manifest = {"format": PACK_FORMAT, "latest": meta["id"], "packs": packs[-PACK_HISTORY:]}
+        _write_atomic(self._path("manifest.json"), json.dumps(manifest, indent=2).encode("utf-8"))
+        logger.info(f"Published knowledge pack {meta['id']} (knowledge {meta['knowledgeVersion']}, triage {meta['triageVersion']})")
+        return manifest
+
+    def _known(self, pack_id: str) -> bool:
+        return any(p["id"] == pack_id for p in self.manifest()["packs"])
+
+    def pack_path(self, pack_id: str) -> Optional[str]:
+        """Path of a published pack's gzip file, or None if the id is not (or no longer) published"""
+        return self._path(f"{pack_id}.json.gz") if self._known(pack_id) else None
+
+    def delta(self, from_id: str, to_id: Optional[str] = None) -> Optional[bytes]:
+        """zstd delta that turns pack from_id into to_id (default latest), or None if either is unknown.
+
+        Clients apply it with zstd decompression using their current pack's bytes as a raw
+        content dictionary (zstd --patch-from).
+        """
+        to_id = to_id or self.manifest()["latest"]
+        if from_id == to_id or not (self._known(from_id) and self._known(to_id)):
+            return None
+        path = self._path(f"{to_id}-{from_id}.delta.zst")
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        except OSError:
+            pass
+        with open(self._path(f"{from_id}.json"), "rb") as fh:
+            base = fh.read()
+        with open(self._path(f"{to_id}.json"), "rb") as fh:
+            target = fh.read()
+        dictionary = zstd.ZstdCompressionDict(base, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+        # The window must reach back across the whole base so unchanged content is referenced, not resent
+        params = zstd.ZstdCompressionParameters.from_level(
+            DELTA_LEVEL, window_log=max(20, (len(base) + len(target)).bit_length()), enable_ldm=True
+        )
+        delta = zstd.ZstdCompressor(dict_data=dictionary, compression_params=params).compress(target)
+        _write_atomic(path, delta)
+        return delta
+
+    @staticmethod
+    def apply_delta(base: bytes, delta: bytes) -> bytes:
+        """What a client does with a delta (kept here for tooling and verification)"""
+        dictionary = zstd.ZstdCompressionDict(base, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+        return zstd.ZstdDecompressor(dict_data=dictionary, max_window_size=1 << 31).decompress(delta)
+
+
+knowledge_packs = KnowledgePackStore(knowledge_base, triage_engine)
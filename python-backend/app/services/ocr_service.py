@@ -5,6 +5,8 @@ import os
 import tempfile
 from typing import Optional
 
+from .file_encryption import open_stored_file, decrypted_copy
+
 class OCRService:
     @staticmethod
     def extract_text_from_file(file_path: str) -> Optional[str]:
@@ -26,14 +28,17 @@ class OCRService:
     @staticmethod
     def _extract_from_image(image_path: str) -> str:
         """Extract text from image file"""
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image)
+        with open_stored_file(image_path) as fh:
+            image = Image.open(fh)
+            text = pytesseract.image_to_string(image)
         return text.strip()
     
     @staticmethod
     def _extract_from_pdf(pdf_path: str) -> str:
         """Extract text from PDF file"""
-        pages = convert_from_path(pdf_path, first_page=1, last_page=3)  # Limit to first 3 pages
+        # pdftoppm needs a real path; encrypted uploads are streamed to a short-lived temp copy
+        with decrypted_copy(pdf_path) as plain_path:
+            pages = convert_from_path(plain_path, first_page=1, last_page=3)  # Limit to first 3 pages
         extracted_text = []
         
         for page in pages:
@@ -0,0 +1,96 @@
+import html
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+# Small English stopword list, roughly what Postgres' 'english' config drops
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the to was were will with
+""".split())
+
+
+def normalize_term(token: str) -> str:
+    """Lowercase and strip simple plurals so 'Fevers' and 'fever' match"""
+    token = token.lower()
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize_term(t) for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class InvertedIndex:
+    """In-memory term -> {doc_id: term frequency} index with TF-IDF ranking.
+
+    Used where Postgres full-text search is not available (e.g. SQLite test runs). Queries
+    behave like plainto_tsquery, which the Postgres search path uses: every query term must be
+    present, and quotes, "or" and "-" are not operators (they are stopwords or punctuation).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[int, int] = {}
+
+    def add(self, doc_id: int, text: str):
+        terms = tokenize(text)
+        self.doc_lengths[doc_id] = len(terms)
+        for term in terms:
+            docs = self.postings[term]
+            docs[doc_id] = docs.get(doc_id, 0) + 1
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[int, float]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+        # Intersect starting from the rarest term
+        terms.sort(key=lambda t: len(self.postings[t]))
+        candidates = set(self.postings[terms[0]])
+        for term in terms[1:]:
+            candidates &= self.postings[term].keys()
+            if not candidates:
+                return []
+        n_docs = len(self.doc_lengths)
+        scores = []
+        for doc_id in candidates:
+            length = self.doc_lengths[doc_id] or 1
+            score = 0.0
+            for term in terms:
+                idf = math.log(1 + n_docs / len(self.postings[term]))
+                score += (self.postings[term][doc_id] / length) * idf
+            scores.append((doc_id, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores[:limit]
+
+
+def highlight(text: str, query: str, max_words: int = 35) -> str:
+    """HTML-escaped snippet around the first query hit, with hits wrapped in <b></b>"""
+    terms = set(tokenize(query))
+    words = (text or "").split()
+    if not words:
+        return ""
+    hits = [i for i, word in enumerate(words) if set(tokenize(word)) & terms]
+    start = max(0, hits[0] - max_words // 3) if hits else 0
+    window = words[start:start + max_words]
+    hit_set = set(hits)
+    parts = []
+    for offset, word in enumerate(window):
+        escaped = html.escape(word)
+        parts.append(f"<b>{escaped}</b>" if start + offset in hit_set else escaped)
+    snippet = " ".join(parts)
+    if start > 0:
+        snippet = "... " + snippet
+    if start + max_words < len(words):
+        snippet += " ..."
+    return snippet
+
+
+def build_index(docs: Iterable[Tuple[int, str]]) -> InvertedIndex:
+    index = InvertedIndex()
+    for doc_id, text in docs:
+        index.add(doc_id, text)
+    return index
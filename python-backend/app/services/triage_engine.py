@@ -1,8 +1,116 @@
-from typing import List, Optional
+import hashlib
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from itertools import repeat
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .keyword_matcher import clinical_matcher, register_vocabulary
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.getenv(
+    "TRIAGE_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "triage_rules.json")
+)
+# How often (seconds) the rules file's mtime is checked for hot reload
+RULES_RELOAD_INTERVAL = float(os.getenv("TRIAGE_RULES_RELOAD_INTERVAL", "2"))
+
+_COMPARISONS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class TriageRule(NamedTuple):
+    """One compiled rule. Either a flag rule (truthy vitals[flag] or symptom present) or a
+    threshold on a numeric vital: compare(value, threshold), or outside [low, high]."""
+    id: str
+    flag: Optional[str]
+    symptom: Optional[str]
+    vital: Optional[str]
+    compare: Optional[object]
+    threshold: Optional[float]
+    low: Optional[float]
+    high: Optional[float]
+    reason: str
+    question: str
+
+
+class TriagePlan(NamedTuple):
+    version: str  # the rule table's "version" + a hash of the file, once loaded by TriageEngine
+    tiers: Tuple[Tuple[str, Tuple[TriageRule, ...]], ...]  # (urgency, rules) in evaluation order
+    fallbacks: Tuple[Tuple[TriageRule, str], ...]  # rule -> specialty when no complaint matched
+    default_urgency: str
+    default_specialty: str
+
+    def test(self, rule: TriageRule, symptoms_l: List[str], vitals: dict):
+        """The vital value the rule fired on (True for flag rules), or None"""
+        if rule.vital is None:
+            return True if (rule.flag and vitals.get(rule.flag)) or (rule.symptom and rule.symptom in symptoms_l) else None
+        value = vitals.get(rule.vital)
+        if value is None:
+            return None
+        if rule.compare is not None:
+            return value if rule.compare(value, rule.threshold) else None
+        return value if (value < rule.low or value > rule.high) else None
+
+
+def compile_rules(spec: dict) -> TriagePlan:
+    """Validate a rule table and flatten it into a TriagePlan; raises ValueError on bad rules"""
+    by_id: Dict[str, TriageRule] = {}
+    tiers = []
+    for tier in spec.get("tiers", []):
+        rules = []
+        for raw in tier.get("rules", []):
+            when = raw.get("when") or {}
+            rule_id = raw.get("id")
+            if not rule_id or rule_id in by_id:
+                raise ValueError(f"Triage rule id missing or duplicated: {rule_id!r}")
+            op = when.get("op")
+            if "vital" in when:
+                if op == "outside":
+                    rule = TriageRule(rule_id, None, None, when["vital"], None, None,
+                                      float(when["low"]), float(when["high"]), raw["reason"], raw.get("question", raw["reason"]))
+                elif op in _COMPARISONS:
+                    rule = TriageRule(rule_id, None, None, when["vital"], _COMPARISONS[op], float(when["value"]),
+                                      None, None, raw["reason"], raw.get("question", raw["reason"]))
+                else:
+                    raise ValueError(f"Triage rule {rule_id}: unsupported op {op!r}")
+            elif "flag" in when or "symptom" in when:
+                symptom = when.get("symptom")
+                rule = TriageRule(rule_id, when.get("flag"), symptom.lower().strip() if symptom else None,
+                                  None, None, None, None, None, raw["reason"], raw.get("question", raw["reason"]))
+            else:
+                raise ValueError(f"Triage rule {rule_id}: 'when' needs a vital or a flag/symptom")
+            by_id[rule_id] = rule
+            rules.append(rule)
+        tiers.append((tier["urgency"], tuple(rules)))
+
+    fallbacks = []
+    for fallback in spec.get("specialtyFallbacks", []):
+        if fallback["rule"] not in by_id:
+            raise ValueError(f"Specialty fallback refers to unknown rule {fallback['rule']!r}")
+        fallbacks.append((by_id[fallback["rule"]], fallback["specialty"]))
+
+    return TriagePlan(
+        version=str(spec.get("version", "0")),
+        tiers=tuple(tiers),
+        fallbacks=tuple(fallbacks),
+        default_urgency=spec.get("defaultUrgency", "routine"),
+        default_specialty=spec.get("defaultSpecialty", "general medicine"),
+    )
+
 
 class TriageEngine:
     """Rule-based triage engine for initial assessment.
     Returns urgency and recommended specialty based on symptoms and vitals.
+
+    Urgency rules come from the versioned rule table (app/data/triage_rules.json, or
+    TRIAGE_RULES_PATH), compiled into a TriagePlan and reloaded when the file changes. The
+    scalar, batch and offline decision-tree outputs are all generated from the same plan.
     """
 
     CONDITION_SPECIALTY_MAP = {
@@ -21,71 +129,209 @@ class TriageEngine:
         "fracture": "orthopedics",
     }
 
+    def __init__(self, rules_path: str = RULES_PATH):
+        self.rules_path = rules_path
+        self._plan: Optional[TriagePlan] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def plan(self) -> TriagePlan:
+        """The compiled rule plan, recompiled if the rules file changed since it was loaded"""
+        now = time.monotonic()
+        if self._plan is not None and now - self._checked_at < RULES_RELOAD_INTERVAL:
+            return self._plan
+        with self._lock:
+            self._checked_at = now
+            mtime = None
+            try:
+                mtime = os.stat(self.rules_path).st_mtime
+                if self._plan is None or mtime != self._mtime:
+                    with open(self.rules_path, "rb") as fh:
+                        raw = fh.read()
+                    plan = compile_rules(json.loads(raw))
+                    # Qualify the declared version with the content, so an edit that forgets to
+                    # bump "version" still changes the decision tree ETag and knowledge pack
+                    plan = plan._replace(version=f"{plan.version}+{hashlib.sha256(raw).hexdigest()[:12]}")
+                    if self._plan is not None:
+                        logger.info(f"Triage rules reloaded: version {self._plan.version} -> {plan.version}")
+                    self._plan, self._mtime = plan, mtime
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Keep serving the last good plan if an edit breaks the file; retry on the next edit
+                if self._plan is None:
+                    raise
+                if mtime is not None:
+                    self._mtime = mtime
+                logger.error(f"Triage rules reload failed, keeping version {self._plan.version}: {str(e)}")
+        return self._plan
+
     def assess(self, symptoms: List[str], vitals: Optional[dict] = None) -> dict:
+        plan = self.plan()
         symptoms_l = [s.lower().strip() for s in symptoms]
         vitals = vitals or {}
-        hr = vitals.get("heartRate")
-        spo2 = vitals.get("spo2")
-        sys = vitals.get("systolic")
-        dia = vitals.get("diastolic")
-        temp = vitals.get("temperature")
-        rr = vitals.get("respRate")
-        age = vitals.get("age")
-        chest_pain = bool(vitals.get("chestPain")) or ("chest pain" in symptoms_l)
-        altered = bool(vitals.get("consciousnessAltered"))
-        pregnancy = bool(vitals.get("pregnancy")) or ("pregnancy" in symptoms_l)
 
         reasons = []
-        urgency = "routine"
-
-        # Red flags → emergency
-        if altered:
-            urgency = "emergency"
-            reasons.append("Altered level of consciousness")
-        if chest_pain:
-            urgency = "emergency"
-            reasons.append("Chest pain")
-        if spo2 is not None and spo2 < 90:
-            urgency = "emergency"
-            reasons.append(f"Low SpO2 ({spo2}%)")
-        if sys is not None and sys < 80:
-            urgency = "emergency"
-            reasons.append(f"Hypotension (SBP {sys})")
-        if rr is not None and (rr < 8 or rr > 30):
-            urgency = "emergency"
-            reasons.append(f"Abnormal respiratory rate ({rr})")
-
-        # Urgent flags
-        if urgency != "emergency":
-            if temp is not None and temp >= 39.5:
-                urgency = "urgent"
-                reasons.append(f"High fever ({temp}°C)")
-            if sys is not None and sys >= 180:
-                urgency = "urgent"
-                reasons.append(f"Hypertensive (SBP {sys})")
-            if hr is not None and (hr < 40 or hr > 130):
-                urgency = "urgent"
-                reasons.append(f"Abnormal heart rate ({hr})")
-
-        # Pregnancy consideration
-        if pregnancy and urgency != "emergency":
-            urgency = "urgent"
-            reasons.append("Pregnancy consideration")
-
-        # Determine recommended specialty by most severe complaint
-        recommended = None
-        for s in symptoms_l:
-            if s in self.CONDITION_SPECIALTY_MAP:
-                recommended = self.CONDITION_SPECIALTY_MAP[s]
+        urgency = plan.default_urgency
+        test = plan.test
+        for tier_urgency, rules in plan.tiers:
+            for rule in rules:
+                value = test(rule, symptoms_l, vitals)
+                if value is not None:
+                    reasons.append(rule.reason.format(value=value))
+            if reasons:
+                urgency = tier_urgency
                 break
-        if chest_pain and not recommended:
-            recommended = "cardiology"
-        if pregnancy and not recommended:
-            recommended = "obstetrics"
+
+        recommended = self._match_specialty(symptoms_l)
+        if not recommended:
+            recommended = next(
+                (specialty for rule, specialty in plan.fallbacks if test(rule, symptoms_l, vitals) is not None),
+                plan.default_specialty
+            )
 
         return {
             "urgency": urgency,
             "reasons": reasons,
-            "recommendedSpecialty": recommended or "general medicine",
+            "recommendedSpecialty": recommended,
+        }
+
+    def _match_specialty(self, symptoms_l: List[str]) -> Optional[str]:
+        # Determine recommended specialty by most severe complaint
+        matcher = clinical_matcher()
+        for s in symptoms_l:
+            # Exact complaints first, then the first known condition mentioned in a free-text one
+            # ("severe chest pain since morning")
+            recommended = self.CONDITION_SPECIALTY_MAP.get(s)
+            if not recommended:
+                recommended = next(
+                    (self.CONDITION_SPECIALTY_MAP[t] for t in matcher.find_terms(s) if t in self.CONDITION_SPECIALTY_MAP),
+                    None
+                )
+            if recommended:
+                return recommended
+        return None
+
+    def assess_batch(self, records: Sequence[Tuple[List[str], Optional[dict]]]) -> List[dict]:
+        """assess() over many (symptoms, vitals) records, with the plan evaluated as array operations.
+
+        Every rule is one boolean mask over the batch; the deciding tier, the reasons that count and
+        the fallback specialty are all derived from those masks, so Python-level work per record is
+        one dict lookup on the way in and one list slice on the way out. Results (urgency, reasons
+        and their order, recommended specialty) are identical to calling assess() on each record.
+        """
+        plan = self.plan()
+        n = len(records)
+        if n == 0:
+            return []
+        rules = [rule for _, tier_rules in plan.tiers for rule in tier_rules]
+        rule_tiers = np.array([t for t, (_, tier_rules) in enumerate(plan.tiers) for _ in tier_rules], dtype=np.intp)
+        rule_symptoms = {rule.symptom for rule in rules if rule.symptom}
+
+        # Screening batches repeat the same few complaint lists, so each distinct list is
+        # normalised and matched once and records refer to it by index
+        complaint_ids: Dict[tuple, int] = {}
+        assign = complaint_ids.setdefault
+        complaint_idx = np.array([assign(tuple(symptoms), len(complaint_ids)) for symptoms, _ in records], dtype=np.intp)
+        mentioned = []
+        specialties = []
+        for symptoms in complaint_ids:
+            symptoms_l = [s.lower().strip() for s in symptoms]
+            mentioned.append(rule_symptoms.intersection(symptoms_l))
+            specialties.append(self._match_specialty(symptoms_l))
+
+        # One column per vital / flag the rules read, gathered with C-level dict.get calls; missing
+        # vitals become NaN in the float columns, which fails every comparison like None
+        empty: dict = {}
+        vitals_list = [vitals or empty for _, vitals in records]
+        raw: Dict[str, list] = {
+            key: list(map(dict.get, vitals_list, repeat(key, n)))
+            for key in {rule.vital or rule.flag for rule in rules if rule.vital or rule.flag}
         }
 
+        fired = np.zeros((n, len(rules)), dtype=bool)
+        for r, rule in enumerate(rules):
+            if rule.vital is not None:
+                values = np.array(raw[rule.vital], dtype=np.float64)
+                if rule.compare is not None:
+                    fired[:, r] = rule.compare(values, rule.threshold)
+                else:
+                    fired[:, r] = (values < rule.low) | (values > rule.high)
+                continue
+            if rule.flag:
+                fired[:, r] = np.array(raw[rule.flag], dtype=bool)
+            if rule.symptom:
+                fired[:, r] |= np.fromiter(
+                    (rule.symptom in m for m in mentioned), dtype=bool, count=len(mentioned)
+                )[complaint_idx]
+
+        # The first tier with a firing rule decides; only that tier's rules give reasons
+        n_tiers = len(plan.tiers)
+        tier_fired = np.zeros((n, n_tiers + 1), dtype=bool)
+        tier_fired[:, n_tiers] = True  # no tier fired: default urgency
+        for t in range(n_tiers):
+            tier_fired[:, t] = fired[:, rule_tiers == t].any(axis=1)
+        decided = np.argmax(tier_fired, axis=1)
+        urgency = np.array([u for u, _ in plan.tiers] + [plan.default_urgency], dtype=object)[decided]
+
+        # Reason texts for every counted (record, rule) hit, in record then rule order
+        rows, cols = np.nonzero(fired & (rule_tiers[None, :] == decided[:, None]))
+        texts = np.empty(rows.size, dtype=object)
+        for r, rule in enumerate(rules):
+            sel = np.flatnonzero(cols == r)
+            if sel.size == 0:
+                continue
+            if rule.vital is None:
+                texts[sel] = rule.reason.format(value=True)
+                continue
+            # Format each distinct value once; keyed by type too, since 85 and 85.0 print differently
+            column = raw[rule.vital]
+            formatted: Dict[tuple, str] = {}
+            texts[sel] = [
+                formatted.get((type(value), value))
+                or formatted.setdefault((type(value), value), rule.reason.format(value=value))
+                for value in map(column.__getitem__, rows[sel].tolist())
+            ]
+        counts = np.bincount(rows, minlength=n)
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        texts = texts.tolist()
+
+        # Complaint specialty, else the first fallback rule that fires, else the default
+        recommended = np.full(n, plan.default_specialty, dtype=object)
+        rule_positions = {rule.id: r for r, rule in enumerate(rules)}
+        for rule, specialty in reversed(plan.fallbacks):
+            recommended[fired[:, rule_positions[rule.id]]] = specialty
+        matched = np.array([s is not None for s in specialties], dtype=bool)[complaint_idx]
+        recommended[matched] = np.array(specialties, dtype=object)[complaint_idx[matched]]
+
+        return [
+            {"urgency": u, "reasons": texts[s:e], "recommendedSpecialty": c}
+            for u, s, e, c in zip(urgency.tolist(), starts.tolist(), ends.tolist(), recommended.tolist())
+        ]
+
+    def decision_tree(self, plan: Optional[TriagePlan] = None) -> dict:
+        """Offline decision tree generated from the plan: one yes/no question per rule, in evaluation order.
+
+        "yes" ends at the rule's tier urgency (the first firing rule decides the tier); "no" moves to
+        the next rule and, after the last tier, to the default urgency.
+        """
+        plan = plan or self.plan()
+        fallback_for = {rule.id: specialty for rule, specialty in plan.fallbacks}
+        node = {"urgency": plan.default_urgency, "recommend": plan.default_specialty}
+        # Built back to front so hundreds of rules do not mean deep recursion
+        for tier_urgency, rules in reversed(plan.tiers):
+            for rule in reversed(rules):
+                node = {
+                    "question": rule.question,
+                    "rule": rule.id,
+                    "yes": {"urgency": tier_urgency, "recommend": fallback_for.get(rule.id, plan.default_specialty)},
+                    "no": node,
+                }
+        return {"version": plan.version, **node}
+
+
+register_vocabulary("triage.conditions", TriageEngine.CONDITION_SPECIALTY_MAP)
+
+
+# Shared engine: the triage routes and the offline knowledge pack read the same plan
+triage_engine = TriageEngine()
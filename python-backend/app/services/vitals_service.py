@@ -0,0 +1,264 @@
+import json
+import os
+import struct
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import zstandard as zstd
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database_enhanced import VitalsChunk, PatientVitalsState
+
+# Column order inside a chunk; never reorder, only append (CHUNK_VERSION records the layout)
+VITAL_FIELDS = (
+    "heartRate", "spo2", "systolic", "diastolic", "temperature", "respRate",
+    "supplementalO2", "consciousnessAltered"
+)
+CHUNK_VERSION = 1
+_HEADER = struct.Struct("<BBI")  # version, field count, reading count
+
+# NEWS2 uses the latest value of each parameter, as long as it is this recent
+NEWS2_MAX_AGE = timedelta(minutes=int(os.getenv("NEWS2_MAX_AGE_MINUTES", "240")))
+_NEWS2_PARAMETERS = ("respRate", "spo2", "supplementalO2", "systolic", "heartRate", "consciousnessAltered", "temperature")
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY_MS = 86_400_000
+
+
+def _epoch_ms(moment: datetime) -> int:
+    return int((moment - _EPOCH).total_seconds() * 1000)
+
+
+def _day_start_ms(day: date) -> int:
+    return (day - _EPOCH.date()).days * _DAY_MS
+
+
+def _band(value: float, bands: Tuple[Tuple[float, int], ...], above: int) -> int:
+    """Score for the first band whose upper bound value does not exceed, else `above`"""
+    for upper, score in bands:
+        if value <= upper:
+            return score
+    return above
+
+
+class VitalsService:
+    """Compact vital-sign storage and NEWS2 early-warning scoring.
+
+    Readings are kept as one row per patient per day: a millisecond-of-day uint32 array and a
+    float32 (readings x VITAL_FIELDS) matrix with NaN for unmeasured values, zstd-compressed.
+    """
+
+    @staticmethod
+    def pack(times_ms: np.ndarray, values: np.ndarray) -> bytes:
+        header = _HEADER.pack(CHUNK_VERSION, len(VITAL_FIELDS), len(times_ms))
+        body = times_ms.astype("<u4").tobytes() + values.astype("<f4").tobytes()
+        return header + zstd.ZstdCompressor(level=3).compress(body)
+
+    @staticmethod
+    def unpack(blob: Optional[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        if not blob:
+            return np.zeros(0, dtype=np.uint32), np.zeros((0, len(VITAL_FIELDS)), dtype=np.float32)
+        version, field_count, n = _HEADER.unpack_from(blob)
+        if version != CHUNK_VERSION:
+            raise ValueError(f"Unsupported vitals chunk version {version}")
+        body = zstd.ZstdDecompressor().decompress(bytes(blob[_HEADER.size:]), max_output_size=n * (4 + 4 * field_count))
+        times_ms = np.frombuffer(body, dtype="<u4", count=n)
+        values = np.frombuffer(body, dtype="<f4", offset=4 * n).reshape(n, field_count)
+        if field_count < len(VITAL_FIELDS):
+            padding = np.full((n, len(VITAL_FIELDS) - field_count), np.nan, dtype=np.float32)
+            values = np.hstack([values, padding])
+        return times_ms, values
+
+    @staticmethod
+    def merge(times_ms: np.ndarray, values: np.ndarray, new_times: np.ndarray, new_values: np.ndarray):
+        """Time-ordered union of two chunk arrays; a new reading replaces an old one with the same timestamp"""
+        times = np.concatenate([times_ms, new_times])
+        rows = np.vstack([values, new_values])
+        order = np.argsort(times, kind="stable")
+        times, rows = times[order], rows[order]
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]  # keep the last of each run of equal timestamps
+        return times[keep], rows[keep]
+
+    @staticmethod
+    def _rows(readings: Iterable[Tuple[datetime, dict]]) -> Dict[date, Tuple[np.ndarray, np.ndarray]]:
+        """Group (UTC timestamp, {field: value}) readings into per-day arrays"""
+        by_day: Dict[date, Tuple[List[int], List[List[float]]]] = {}
+        for moment, vitals in readings:
+            day = moment.date()
+            times, rows = by_day.setdefault(day, ([], []))
+            times.append(_epoch_ms(moment) - _day_start_ms(day))
+            rows.append([np.nan if vitals.get(f) is None else float(vitals[f]) for f in VITAL_FIELDS])
+        return {
+            day: (np.asarray(times, dtype=np.uint32), np.asarray(rows, dtype=np.float32).reshape(-1, len(VITAL_FIELDS)))
+            for day, (times, rows) in by_day.items()
+        }
+
+    @staticmethod
+    def store_readings(db: Session, patient_id: int, readings: List[Tuple[datetime, dict]]) -> int:
+        """Merge readings into the patient's day chunks (one read-modify-write per day touched).
+
+        The caller commits; returns the number of days touched.
+        """
+        grouped = VitalsService._rows(readings)
+        for day, (new_times, new_values) in grouped.items():
+            chunk = db.query(VitalsChunk).filter(
+                VitalsChunk.patient_id == patient_id, VitalsChunk.day == day
+            ).with_for_update().first()
+            if chunk is None:
+                # First readings for this day; a concurrent ingest may create the row first
+                try:
+                    with db.begin_nested():
+                        chunk = VitalsChunk(patient_id=patient_id, day=day, reading_count=0, data=None)
+                        db.add(chunk)
+                except IntegrityError:
+                    chunk = db.query(VitalsChunk).filter(
+                        VitalsChunk.patient_id == patient_id, VitalsChunk.day == day
+                    ).with_for_update().first()
+            times_ms, values = VitalsService.unpack(chunk.data)
+            times_ms, values = VitalsService.merge(times_ms, values, new_times, new_values)
+            chunk.data = VitalsService.pack(times_ms, values)
+            chunk.reading_count = len(times_ms)
+        return len(grouped)
+
+    @staticmethod
+    def query_range(
+        db: Session, patient_id: int, start: datetime, end: datetime, bucket_seconds: int
+    ) -> dict:
+        """Readings in [start, end) averaged into fixed buckets (NaN-aware: a bucket's mean per vital
+        uses only readings that measured it)"""
+        start_ms, end_ms = _epoch_ms(start), _epoch_ms(end)
+        bucket_ms = max(int(bucket_seconds * 1000), 1)
+        chunks = db.query(VitalsChunk.day, VitalsChunk.data).filter(
+            VitalsChunk.patient_id == patient_id,
+            VitalsChunk.day >= start.date(),
+            VitalsChunk.day <= end.date()
+        ).order_by(VitalsChunk.day).all()
+
+        all_times, all_values = [], []
+        for day, blob in chunks:
+            times_ms, values = VitalsService.unpack(blob)
+            absolute = times_ms.astype(np.int64) + _day_start_ms(day)
+            in_range = (absolute >= start_ms) & (absolute < end_ms)
+            all_times.append(absolute[in_range])
+            all_values.append(values[in_range])
+        if not all_times or not sum(len(t) for t in all_times):
+            return {"fields": list(VITAL_FIELDS), "bucketSeconds": bucket_ms / 1000, "timestamps": [], "counts": [], "values": {f: [] for f in VITAL_FIELDS}}
+
+        times = np.concatenate(all_times)
+        values = np.vstack(all_values).astype(np.float64)
+        buckets = (times - start_ms) // bucket_ms
+        occupied, inverse = np.unique(buckets, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(occupied))
+
+        series = {}
+        for column, field in enumerate(VITAL_FIELDS):
+            measured = ~np.isnan(values[:, column])
+            sums = np.bincount(inverse[measured], weights=values[measured, column], minlength=len(occupied))
+            n = np.bincount(inverse[measured], minlength=len(occupied))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / n
+            series[field] = [None if np.isnan(v) else round(float(v), 2) for v in means]
+
+        return {
+            "fields": list(VITAL_FIELDS),
+            "bucketSeconds": bucket_ms / 1000,
+            "timestamps": [(_EPOCH + timedelta(milliseconds=int(start_ms + b * bucket_ms))).isoformat() + "Z" for b in occupied],
+            "counts": counts.tolist(),
+            "values": series,
+        }
+
+    @staticmethod
+    def news2_parameter_score(parameter: str, value: float) -> int:
+        """NEWS2 (RCP 2017) sub-score for one parameter; SpO2 uses scale 1"""
+        if parameter == "respRate":
+            return _band(value, ((8, 3), (11, 1), (20, 0), (24, 2)), 3)
+        if parameter == "spo2":
+            return _band(value, ((91, 3), (93, 2), (95, 1)), 0)
+        if parameter == "supplementalO2":
+            return 2 if value else 0
+        if parameter == "systolic":
+            return _band(value, ((90, 3), (100, 2), (110, 1), (219, 0)), 3)
+        if parameter == "heartRate":
+            return _band(value, ((40, 3), (50, 1), (90, 0), (110, 1), (130, 2)), 3)
+        if parameter == "consciousnessAltered":
+            return 3 if value else 0
+        if parameter == "temperature":
+            return _band(value, ((35.0, 3), (36.0, 1), (38.0, 0), (39.0, 1)), 2)
+        raise ValueError(f"Not a NEWS2 parameter: {parameter}")
+
+    @staticmethod
+    def news2_risk(total: int, max_single: int) -> str:
+        if total >= 7:
+            return "high"
+        if total >= 5:
+            return "medium"
+        if max_single >= 3:
+            return "low-medium"
+        return "low"
+
+    @staticmethod
+    def update_state(db: Session, patient_id: int, readings: List[Tuple[datetime, dict]]) -> PatientVitalsState:
+        """Fold new readings into the patient's latest-value state and rescore NEWS2.
+
+        Only the latest observation per parameter is kept, so the cost is per reading, not per
+        stored history; out-of-order (older) readings do not displace newer values. The caller commits.
+        """
+        state = db.query(PatientVitalsState).filter(
+            PatientVitalsState.patient_id == patient_id
+        ).with_for_update().first()
+        if state is None:
+            state = PatientVitalsState(patient_id=patient_id, latest="{}")
+            db.add(state)
+        latest: Dict[str, List] = json.loads(state.latest or "{}")
+
+        for moment, vitals in readings:
+            at = _epoch_ms(moment)
+            for field in VITAL_FIELDS:
+                value = vitals.get(field)
+                if value is None:
+                    continue
+                current = latest.get(field)
+                if current is None or at >= current[0]:
+                    latest[field] = [at, float(value)]
+
+        newest = max((at for at, _ in latest.values()), default=None)
+        total, max_single, complete = 0, 0, True
+        if newest is not None:
+            cutoff = newest - int(NEWS2_MAX_AGE.total_seconds() * 1000)
+            for parameter in _NEWS2_PARAMETERS:
+                observed = latest.get(parameter)
+                if observed is None or observed[0] < cutoff:
+                    if parameter in ("supplementalO2", "consciousnessAltered"):
+                        continue  # not recorded means room air / alert
+                    complete = False
+                    continue
+                score = VitalsService.news2_parameter_score(parameter, observed[1])
+                total += score
+                max_single = max(max_single, score)
+
+        state.latest = json.dumps(latest)
+        if newest is not None:
+            state.last_reading_at = _EPOCH + timedelta(milliseconds=newest)
+            state.news2_score = total
+            state.news2_risk = VitalsService.news2_risk(total, max_single)
+            state.news2_complete = complete
+        return state
+
+    @staticmethod
+    def state_summary(state: Optional[PatientVitalsState]) -> dict:
+        if state is None:
+            return {"news2Score": None, "news2Risk": None, "complete": False, "lastReadingAt": None, "latest": {}}
+        latest = json.loads(state.latest or "{}")
+        return {
+            "news2Score": state.news2_score,
+            "news2Risk": state.news2_risk,
+            "complete": bool(state.news2_complete),
+            "lastReadingAt": state.last_reading_at.isoformat() + "Z" if state.last_reading_at else None,
+            "latest": {
+                field: {"value": value, "at": (_EPOCH + timedelta(milliseconds=at)).isoformat() + "Z"}
+                for field, (at, value) in latest.items()
+            },
+        }
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Compare the shared Aho-Corasick keyword matcher against the per-term substring scan it replaced.
+Run from python-backend/: python benchmarks/bench_keyword_matcher.py [--terms 10000] [--docs 200]
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.keyword_matcher import KeywordMatcher
+
+
+def random_word(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def naive_find(terms, text):
+    text_l = text.lower()
+    return [term for term in terms if term in text_l]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=10000)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=800, help="words per document (a page or two of OCR text)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = [random_word(rng, rng.randint(4, 9)) for _ in range(args.words)]
+    terms = list({
+        " ".join(random_word(rng, rng.randint(4, 9)) for _ in range(rng.randint(1, 3)))
+        for _ in range(args.terms)
+    })
+    docs = []
+    for _ in range(args.docs):
+        words = [rng.choice(vocabulary) for _ in range(args.words)]
+        for _ in range(5):
+            words.insert(rng.randrange(len(words)), rng.choice(terms))
+        docs.append(" ".join(words))
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(terms)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    automaton_hits = sum(len(matcher.find_terms(doc)) for doc in docs)
+    automaton = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive_hits = sum(len(naive_find(terms, doc)) for doc in docs)
+    naive = time.perf_counter() - start
+
+    print(f"{len(terms)} terms, {len(docs)} documents of ~{args.words} words")
+    print(f"automaton build:    {build * 1000:8.1f} ms")
+    print(f"aho-corasick:       {automaton * 1000 / len(docs):8.2f} ms/doc  ({automaton_hits} matches)")
+    print(f"substring scan:     {naive * 1000 / len(docs):8.2f} ms/doc  ({naive_hits} matches)")
+    print(f"speedup:            {naive / automaton:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Throughput of TriageEngine.assess_batch against calling assess() per record, and a check that
+both produce identical results.
+Run from python-backend/: python benchmarks/bench_triage_batch.py [--records 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.triage_engine import TriageEngine
+
+SYMPTOMS = ["fever", "headache", "chest pain", "rash", "cough", "pregnancy", "abdominal pain",
+            "shortness of breath", "fatigue", "severe headache since morning"]
+
+
+def maybe(rng, value, p=0.8):
+    return value if rng.random() < p else None
+
+
+def random_record(rng):
+    vitals = {
+        "heartRate": maybe(rng, rng.randint(30, 160)),
+        "spo2": maybe(rng, rng.randint(80, 100)),
+        "systolic": maybe(rng, rng.randint(70, 200)),
+        "diastolic": maybe(rng, rng.randint(40, 120)),
+        "temperature": maybe(rng, round(rng.uniform(35.5, 41.0), 1)),
+        "respRate": maybe(rng, rng.randint(5, 35)),
+        "age": maybe(rng, rng.randint(0, 95)),
+        "chestPain": maybe(rng, rng.random() < 0.05, 0.5),
+        "consciousnessAltered": maybe(rng, rng.random() < 0.02, 0.5),
+        "pregnancy": maybe(rng, rng.random() < 0.05, 0.5),
+    }
+    return rng.sample(SYMPTOMS, rng.randint(0, 3)), (vitals if rng.random() < 0.95 else None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    records = [random_record(rng) for _ in range(args.records)]
+    engine = TriageEngine()
+
+    start = time.perf_counter()
+    scalar = [engine.assess(symptoms, vitals) for symptoms, vitals in records]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = engine.assess_batch(records)
+    batch_time = time.perf_counter() - start
+
+    assert batch == scalar, "batch results differ from the scalar path"
+    print(f"{args.records} records, results identical")
+    print(f"assess() loop:   {scalar_time:7.2f} s  ({args.records / scalar_time:10.0f} records/s)")
+    print(f"assess_batch():  {batch_time:7.2f} s  ({args.records / batch_time:10.0f} records/s)")
+    print(f"speedup:         {scalar_time / batch_time:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from slowapi import _rate_limit_exceeded_handler
@@ -15,14 +16,20 @@ from app.routes import admin  # New admin routes
 from app.routes import triage, sync  # New features
 from app.routes import ocr  # OCR functionality
 from app.routes import medical_history  # Medical history access
-from app.middleware.auth_middleware import get_current_user
+from app.routes import vitals  # Vitals time series and NEWS2
+from app.middleware.auth_middleware import get_current_user, jwt_secret
 from app.database_enhanced import create_tables  # Enhanced database
+from app.services.keyword_matcher import clinical_matcher
+from app.services.knowledge_base import knowledge_base
+from app.services.knowledge_pack import knowledge_packs
+from app.services.doctor_directory import doctor_directory, doctor_load
 
 load_dotenv()
 
 # Fail fast on critical secrets
 if not os.getenv("JWT_SECRET"):
     raise RuntimeError("JWT_SECRET environment variable is not set")
+jwt_secret()  # load the signing key once for the process
 if not os.getenv("ENCRYPTION_KEY"):
     raise RuntimeError("ENCRYPTION_KEY environment variable is not set")
 
@@ -43,6 +50,13 @@ if not os.getenv("SUPER_ADMIN_SETUP_KEY"):
 # Create enhanced database tables
 create_tables()
 
+# Compile the shared clinical keyword automaton once the route modules have registered their vocabularies
+clinical_matcher()
+
+# The knowledge base, doctor directory and offline knowledge pack all load on first use. Set
+# WARM_CACHES_ON_STARTUP=1 to build them while each worker starts instead of on its first requests.
+WARM_CACHES_ON_STARTUP = os.getenv("WARM_CACHES_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
 # Create secure documents directory
 os.makedirs('secure_documents', exist_ok=True)
 
@@ -74,6 +88,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_caches():
+    if not WARM_CACHES_ON_STARTUP:
+        return
+    # Autocomplete index (this also loads the symptom rules, registering their vocabulary)
+    await run_in_threadpool(lambda: knowledge_base.suggestions)
+    # Verified-doctor directory and open-consultation counts used for specialist matching
+    await run_in_threadpool(doctor_directory.load)
+    await run_in_threadpool(doctor_load.load)
+    # Offline knowledge pack for the current knowledge and triage rules (no-op if unchanged)
+    await run_in_threadpool(knowledge_packs.manifest)
+
 @app.get("/")
 async def root():
     return {
@@ -100,6 +126,7 @@ app.include_router(triage.router, prefix="/api/triage", tags=["triage"])
 app.include_router(sync.router, prefix="/api/sync", tags=["sync"])
 app.include_router(ocr.router, prefix="/api/ocr", tags=["ocr"])
 app.include_router(medical_history.router, prefix="/api/medical-history", tags=["medical-history"])
+app.include_router(vitals.router, prefix="/api/vitals", tags=["vitals"])
 
 # Socket.IO events
 @sio.event
@@ -9,8 +9,73 @@ import sys
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
+from app.compression import compress_text, decompress_text, ZSTD_MAGIC
+
 load_dotenv()
 
+COMPRESSED_COLUMNS = [
+    ("medical_files", "ocr_text"),
+    ("consultations", "symptoms"),
+    ("consultations", "notes"),
+]
+
+def compress_existing_rows(conn, table, column, batch_size=500):
+    """Rewrite plain UTF-8 values (left by the TEXT -> BYTEA conversion) as zstd frames"""
+    last_id = 0
+    rewritten = 0
+    while True:
+        rows = conn.execute(text(f"""
+            SELECT id, {column} FROM {table}
+            WHERE id > :last_id AND {column} IS NOT NULL
+            ORDER BY id LIMIT :batch_size
+        """), {"last_id": last_id, "batch_size": batch_size}).fetchall()
+        if not rows:
+            break
+        for row_id, value in rows:
+            value = bytes(value)
+            if not value.startswith(ZSTD_MAGIC):
+                compressed = compress_text(value.decode("utf-8"))
+                if compressed != value:
+                    conn.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"),
+                                 {"value": compressed, "id": row_id})
+                    rewritten += 1
+        last_id = rows[-1][0]
+        conn.commit()
+    return rewritten
+
+def backfill_clinical_features(conn, batch_size=500):
+    """Extract keywords for files OCR'd before feature extraction existed and roll them up per patient"""
+    from app.services.ai_recommendation import AIRecommendationService
+    last_id = 0
+    patient_specialties = {}
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, patient_id, ocr_text FROM medical_files
+            WHERE id > :last_id AND ocr_text IS NOT NULL AND clinical_keywords IS NULL
+            ORDER BY id LIMIT :batch_size
+        """), {"last_id": last_id, "batch_size": batch_size}).fetchall()
+        if not rows:
+            break
+        for file_id, patient_id, ocr_text in rows:
+            conditions, specialties = AIRecommendationService.extract_clinical_features(decompress_text(ocr_text))
+            conn.execute(text("""
+                UPDATE medical_files SET clinical_keywords = :conditions, clinical_specialties = :specialties
+                WHERE id = :id
+            """), {"conditions": conditions, "specialties": specialties, "id": file_id})
+            patient_specialties.setdefault(patient_id, set()).update(specialties)
+        last_id = rows[-1][0]
+        conn.commit()
+    for patient_id, specialties in patient_specialties.items():
+        if specialties:
+            conn.execute(text("""
+                UPDATE patients SET clinical_specialties = ARRAY(
+                    SELECT DISTINCT unnest(coalesce(clinical_specialties, '{}') || CAST(:specialties AS VARCHAR[]))
+                    ORDER BY 1
+                ) WHERE id = :id
+            """), {"specialties": sorted(specialties), "id": patient_id})
+    conn.commit()
+    return len(patient_specialties)
+
 def migrate_database():
     DATABASE_URL = os.getenv("DATABASE_URL")
     if not DATABASE_URL:
@@ -26,7 +91,10 @@ def migrate_database():
                 SELECT column_name 
                 FROM information_schema.columns 
                 WHERE table_name = 'medical_files' 
-                AND column_name IN ('consultation_id', 'description', 'category')
+                AND column_name IN ('consultation_id', 'description', 'category', 'content_hash',
+                                    'dicom_modality', 'dicom_study_date', 'dicom_body_part',
+                                    'dicom_study_uid', 'dicom_frame_count', 'ocr_tsv',
+                                    'clinical_keywords', 'clinical_specialties')
             """))
             existing_columns = [row[0] for row in result]
             
@@ -58,6 +126,88 @@ def migrate_database():
                 conn.commit()
                 print("✓ category column added")
             
+            if 'content_hash' not in existing_columns:
+                print("Adding content_hash column...")
+                conn.execute(text("""
+                    ALTER TABLE medical_files 
+                    ADD COLUMN content_hash VARCHAR(64)
+                """))
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS ix_medical_files_content_hash ON medical_files (content_hash)
+                """))
+                conn.commit()
+                print("✓ content_hash column added")
+            
+            dicom_columns = {
+                'dicom_modality': ('VARCHAR(16)', True),
+                'dicom_study_date': ('DATE', True),
+                'dicom_body_part': ('VARCHAR(64)', True),
+                'dicom_study_uid': ('VARCHAR(64)', True),
+                'dicom_frame_count': ('INTEGER', False),
+            }
+            for column, (column_type, indexed) in dicom_columns.items():
+                if column not in existing_columns:
+                    print(f"Adding {column} column...")
+                    conn.execute(text(f"ALTER TABLE medical_files ADD COLUMN {column} {column_type}"))
+                    if indexed:
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_medical_files_{column} ON medical_files ({column})"))
+                    conn.commit()
+                    print(f"✓ {column} column added")
+            
+            if 'ocr_tsv' not in existing_columns:
+                print("Adding ocr_tsv full-text search column...")
+                conn.execute(text("""
+                    ALTER TABLE medical_files 
+                    ADD COLUMN ocr_tsv TSVECTOR
+                """))
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS ix_medical_files_ocr_tsv ON medical_files USING GIN (ocr_tsv)
+                """))
+                conn.commit()
+                print("✓ ocr_tsv column and GIN index added")
+            
+            # ocr_tsv used to be GENERATED from ocr_text; it is now written by the application
+            # because ocr_text is stored compressed
+            generated = conn.execute(text("""
+                SELECT is_generated FROM information_schema.columns
+                WHERE table_name = 'medical_files' AND column_name = 'ocr_tsv'
+            """)).scalar()
+            if generated == 'ALWAYS':
+                conn.execute(text("ALTER TABLE medical_files ALTER COLUMN ocr_tsv DROP EXPRESSION"))
+                conn.commit()
+                print("✓ ocr_tsv converted to an application-maintained column")
+            
+            # Switch long text columns to compressed BYTEA storage
+            for table, column in COMPRESSED_COLUMNS:
+                data_type = conn.execute(text("""
+                    SELECT data_type FROM information_schema.columns
+                    WHERE table_name = :table AND column_name = :column
+                """), {"table": table, "column": column}).scalar()
+                if data_type == 'text':
+                    print(f"Converting {table}.{column} to compressed storage...")
+                    if (table, column) == ("medical_files", "ocr_text"):
+                        conn.execute(text("""
+                            UPDATE medical_files SET ocr_tsv = to_tsvector('english', coalesce(ocr_text, ''))
+                        """))
+                    conn.execute(text(f"""
+                        ALTER TABLE {table}
+                        ALTER COLUMN {column} TYPE BYTEA USING convert_to({column}, 'UTF8')
+                    """))
+                    conn.commit()
+                    rewritten = compress_existing_rows(conn, table, column)
+                    print(f"✓ {table}.{column} compressed ({rewritten} rows rewritten)")
+            
+            for column in ('clinical_keywords', 'clinical_specialties'):
+                if column not in existing_columns:
+                    print(f"Adding {column} column...")
+                    conn.execute(text(f"ALTER TABLE medical_files ADD COLUMN {column} VARCHAR[]"))
+                    conn.commit()
+                    print(f"✓ {column} column added")
+            conn.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS clinical_specialties VARCHAR[]"))
+            conn.commit()
+            patients_updated = backfill_clinical_features(conn)
+            print(f"✓ clinical features backfilled ({patients_updated} patients)")
+            
             # Create medical_file_access table if it doesn't exist
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS medical_file_access (
@@ -74,6 +224,7 @@ def migrate_database():
             print("✓ medical_file_access table created/verified")
             
             print("\n🎉 Database migration completed successfully!")
+            print("Run VACUUM FULL on medical_files and consultations to reclaim space from compressed rows.")
             print("You can now restart the backend server.")
             
     except Exception as e:
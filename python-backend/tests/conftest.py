@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the app package from the backend root, however pytest is invoked
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.database_enhanced requires DATABASE_URL at import time; tests that touch the database
+# bind their own engine
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import TTLCache
+from app.database_enhanced import RevokedToken
+from app.middleware import auth_middleware
+from app.middleware.auth_middleware import (
+    JWT_ALGORITHM,
+    _refresh_revocations,
+    create_access_token,
+    revoke_token,
+    verify_token,
+)
+from app.routes.auth import logout
+
+SECRET = "test-secret"
+
+
+@pytest.fixture(autouse=True)
+def token_state(tmp_path, monkeypatch):
+    """Fresh signing key, verification cache, revocation list and revoked_tokens table per test"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    RevokedToken.__table__.create(engine)
+    monkeypatch.setattr(auth_middleware, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setenv("JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth_middleware, "_secret", None)
+    monkeypatch.setattr(auth_middleware, "_revoked", {})
+    monkeypatch.setattr(auth_middleware, "_revoked_loaded_at", time.monotonic())
+    monkeypatch.setattr(auth_middleware, "_verified_tokens", TTLCache(maxsize=16, ttl=300))
+    yield engine
+    engine.dispose()
+
+
+def _credentials(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def _verify_fails(token: str) -> str:
+    with pytest.raises(HTTPException) as exc:
+        verify_token(_credentials(token))
+    assert exc.value.status_code == 401
+    return exc.value.detail
+
+
+def test_valid_token_is_verified_and_cached():
+    token = create_access_token({"id": 7, "role": "patient"})
+    first = verify_token(_credentials(token))
+    assert first["id"] == 7 and first["jti"]
+    assert len(auth_middleware._verified_tokens) == 1
+    first["role"] = "admin"  # callers get a copy, not the cached payload
+    assert verify_token(_credentials(token))["role"] == "patient"
+
+
+def test_expired_token_is_rejected_on_cache_hit(monkeypatch):
+    token = create_access_token({"id": 7})
+    exp = verify_token(_credentials(token))["exp"]
+    monkeypatch.setattr(auth_middleware.time, "time", lambda: exp + 1)
+    assert _verify_fails(token) == "Invalid token"
+    assert len(auth_middleware._verified_tokens) == 0
+
+
+def test_token_without_exp_is_rejected():
+    token = jwt.encode({"id": 7, "jti": "no-exp"}, SECRET, algorithm=JWT_ALGORITHM)
+    assert _verify_fails(token) == "Invalid token"
+    assert len(auth_middleware._verified_tokens) == 0
+
+
+def test_token_with_wrong_signature_is_rejected():
+    token = jwt.encode({"id": 7, "exp": int(time.time()) + 60}, "other-secret", algorithm=JWT_ALGORITHM)
+    assert _verify_fails(token) == "Invalid token"
+
+
+def test_logout_revokes_token_in_process(token_state):
+    token = create_access_token({"id": 7, "email": "p@example.com"})
+    current_user = verify_token(_credentials(token))  # now cached
+    asyncio.run(logout(current_user))
+    assert _verify_fails(token) == "Token has been revoked"
+    with token_state.connect() as conn:
+        assert conn.execute(RevokedToken.__table__.select()).fetchall()[0].jti == current_user["jti"]
+
+
+def test_revoking_twice_records_one_row(token_state):
+    exp = time.time() + 60
+    revoke_token("jti-1", exp, 7)
+    revoke_token("jti-1", exp, 7)
+    with token_state.connect() as conn:
+        assert len(conn.execute(RevokedToken.__table__.select()).fetchall()) == 1
+
+
+def test_refresh_picks_up_revocation_recorded_in_db(token_state):
+    token = create_access_token({"id": 7})
+    payload = verify_token(_credentials(token))
+    # Another worker handled the logout: only the database knows about it
+    with token_state.begin() as conn:
+        conn.execute(RevokedToken.__table__.insert().values(
+            jti=payload["jti"], user_id=7, expires_at=datetime.utcfromtimestamp(payload["exp"])
+        ))
+    assert verify_token(_credentials(token))["jti"] == payload["jti"]  # not refreshed yet
+    _refresh_revocations(force=True)
+    assert _verify_fails(token) == "Token has been revoked"
+
+
+def test_refresh_drops_expired_and_keeps_local_revocations(token_state):
+    with token_state.begin() as conn:
+        conn.execute(RevokedToken.__table__.insert().values(
+            jti="expired", user_id=7, expires_at=datetime.utcfromtimestamp(time.time() - 60)
+        ))
+    auth_middleware._revoked["local"] = time.time() + 60
+    _refresh_revocations(force=True)
+    assert set(auth_middleware._revoked) == {"local"}
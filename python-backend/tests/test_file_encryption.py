@@ -0,0 +1,148 @@
+import io
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.services import file_encryption
+from app.services.file_encryption import (
+    EncryptedFileReader,
+    EncryptedFileWriter,
+    TAG_SIZE,
+    encrypt_stream,
+    is_encrypted,
+    iter_stored_file,
+    open_stored_file,
+    stored_file_hash,
+    stored_file_size,
+)
+
+CHUNK = 64
+DATA = os.urandom(CHUNK * 5 + 17)  # five full chunks and a short final one
+
+
+@pytest.fixture(autouse=True)
+def encryption_key(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+
+@pytest.fixture
+def encrypted_path(tmp_path):
+    path = str(tmp_path / "scan.bin")
+    encrypt_stream(io.BytesIO(DATA), path, chunk_size=CHUNK)
+    return path
+
+
+def _header_size(path):
+    with EncryptedFileReader(path) as reader:
+        return len(reader._header)
+
+
+def _rewrite_chunks(path, edit):
+    """Apply edit(list of stored chunks) to the ciphertext body of an encrypted file"""
+    header = _header_size(path)
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    stored = CHUNK + TAG_SIZE
+    chunks = [raw[i:i + stored] for i in range(header, len(raw), stored)]
+    with open(path, "wb") as fh:
+        fh.write(raw[:header] + b"".join(edit(chunks)))
+
+
+def test_round_trip(tmp_path, encrypted_path):
+    size, digest = encrypt_stream(io.BytesIO(DATA), str(tmp_path / "again.bin"), chunk_size=CHUNK)
+    assert size == len(DATA)
+    assert is_encrypted(encrypted_path)
+    assert DATA not in open(encrypted_path, "rb").read()
+    with open_stored_file(encrypted_path) as fh:
+        assert fh.read() == DATA
+    assert stored_file_size(encrypted_path) == len(DATA)
+    assert stored_file_hash(encrypted_path) == digest
+
+
+def test_round_trip_empty_and_exact_chunk(tmp_path):
+    for data in (b"", os.urandom(CHUNK * 2)):
+        path = str(tmp_path / f"{len(data)}.bin")
+        with EncryptedFileWriter(path, CHUNK) as writer:
+            writer.write(data)
+        assert stored_file_size(path) == len(data)
+        assert b"".join(iter_stored_file(path)) == data
+
+
+def test_plaintext_files_are_read_as_is(tmp_path):
+    path = str(tmp_path / "legacy.bin")
+    with open(path, "wb") as fh:
+        fh.write(DATA)
+    assert not is_encrypted(path)
+    assert stored_file_size(path) == len(DATA)
+    assert b"".join(iter_stored_file(path, 10, 99)) == DATA[10:100]
+
+
+@pytest.mark.parametrize("start,end", [
+    (0, CHUNK - 1),
+    (CHUNK - 3, CHUNK + 2),  # straddles one chunk boundary
+    (CHUNK + 5, CHUNK * 4 + 1),  # spans several chunks
+    (CHUNK * 5, len(DATA) - 1),  # the short final chunk
+    (len(DATA) - 1, len(DATA) - 1),
+])
+def test_ranged_reads_across_chunk_boundaries(encrypted_path, start, end):
+    assert b"".join(iter_stored_file(encrypted_path, start, end, block_size=7)) == DATA[start:end + 1]
+
+
+def test_seek_and_read(encrypted_path):
+    with open_stored_file(encrypted_path) as fh:
+        fh.seek(-20, io.SEEK_END)
+        assert fh.read() == DATA[-20:]
+        fh.seek(CHUNK * 2 - 1)
+        assert fh.read(3) == DATA[CHUNK * 2 - 1:CHUNK * 2 + 2]
+        fh.seek(len(DATA) + 10)
+        assert fh.read() == b""
+
+
+def test_truncated_file_is_detected(encrypted_path):
+    _rewrite_chunks(encrypted_path, lambda chunks: chunks[:-1])
+    with pytest.raises(InvalidTag):
+        with open_stored_file(encrypted_path) as fh:
+            fh.read()
+
+
+def test_reordered_chunks_are_detected(encrypted_path):
+    _rewrite_chunks(encrypted_path, lambda chunks: [chunks[1], chunks[0]] + chunks[2:])
+    with pytest.raises(InvalidTag):
+        with open_stored_file(encrypted_path) as fh:
+            fh.read(CHUNK)
+
+
+def test_tampered_chunk_is_detected(encrypted_path):
+    def flip(chunks):
+        chunks[2] = chunks[2][:10] + bytes([chunks[2][10] ^ 1]) + chunks[2][11:]
+        return chunks
+    _rewrite_chunks(encrypted_path, flip)
+    with open_stored_file(encrypted_path) as fh:
+        assert fh.read(CHUNK * 2) == DATA[:CHUNK * 2]  # untouched chunks still decrypt
+        with pytest.raises(InvalidTag):
+            fh.read(CHUNK)
+
+
+def test_tampered_header_is_detected(encrypted_path):
+    with open(encrypted_path, "r+b") as fh:
+        fh.seek(_header_size(encrypted_path) - 1)  # last byte of the nonce prefix
+        last = fh.read(1)
+        fh.seek(-1, io.SEEK_CUR)
+        fh.write(bytes([last[0] ^ 1]))
+    with pytest.raises(InvalidTag):
+        b"".join(iter_stored_file(encrypted_path))
+
+
+def test_wrong_key_fails(encrypted_path, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    with pytest.raises(InvalidToken):
+        open_stored_file(encrypted_path)
+
+
+def test_missing_key_fails(tmp_path, monkeypatch):
+    monkeypatch.delenv("ENCRYPTION_KEY")
+    with pytest.raises(RuntimeError):
+        file_encryption.write_encrypted_bytes(str(tmp_path / "thumb.bin"), b"x")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Train a zstd dictionary for compressed clinical text (OCR output, symptoms, notes)
+Samples existing rows, writes app/data/zstd/medical-text-<dict_id>.dict and prints the file name.
+Keep old dictionaries in place: rows compressed with them still reference their dict id.
+"""
+
+import os
+import sys
+import zstandard as zstd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DICTIONARY_SIZE = 112 * 1024
+MAX_SAMPLES = 20000
+
+def train_dictionary():
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set")
+        sys.exit(1)
+
+    from app.compression import DICTIONARY_DIR
+    from app.database_enhanced import SessionLocal, MedicalFile, Consultation
+
+    db = SessionLocal()
+    try:
+        samples = []
+        for (value,) in db.query(MedicalFile.ocr_text).filter(MedicalFile.ocr_text.isnot(None)).limit(MAX_SAMPLES):
+            samples.append(value.encode("utf-8"))
+        for symptoms, notes in db.query(Consultation.symptoms, Consultation.notes).limit(MAX_SAMPLES):
+            samples.extend(v.encode("utf-8") for v in (symptoms, notes) if v)
+    finally:
+        db.close()
+
+    if len(samples) < 100:
+        print(f"❌ Only {len(samples)} samples available; need at least 100 to train a useful dictionary")
+        sys.exit(1)
+
+    dictionary = zstd.train_dictionary(DICTIONARY_SIZE, samples)
+    os.makedirs(DICTIONARY_DIR, exist_ok=True)
+    path = os.path.join(DICTIONARY_DIR, f"medical-text-{dictionary.dict_id()}.dict")
+    with open(path, "wb") as fh:
+        fh.write(dictionary.as_bytes())
+
+    print(f"✓ Trained dictionary {dictionary.dict_id()} from {len(samples)} samples")
+    print(f"✓ Written to {path}")
+    print("Set ZSTD_DICTIONARY to this file name (or leave unset to use the newest) and restart the backend.")
+
+if __name__ == "__main__":
+    train_dictionary()